@@ -7,14 +7,20 @@ from utils.models import db, Invoice, Product
 from utils.logs import logging_setup
 from utils.process_json import json_to_db
 from utils.seeder import seed_data
+from utils.summary import ensure_summary
+from utils.migrations import upgrade
+from utils.jobs import start_workers
+from utils.result_cache import ResultCache
+from utils.uploads import ChunkedUploads
+from utils.storage import database_config, configure_engines
 import os
 
 # Initialize Flask app
 app = Flask(__name__)
 Scss(app)
 
-# Configure SQLAlchemy
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///database.db"
+# Configure SQLAlchemy, $DATABASE_URL can point at a server database
+app.config.update(database_config())
 db.init_app(app)
 
 # Define the upload folder
@@ -23,16 +29,42 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Upload budgets: bytes per file, and per request (a whole form post or one chunk)
+app.config["MAX_UPLOAD_FILE_BYTES"] = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", 200 * 1024 * 1024))
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_REQUEST_BYTES", 64 * 1024 * 1024))
+app.config["UPLOAD_CHUNK_BYTES"] = min(
+    int(os.environ.get("UPLOAD_CHUNK_BYTES", 8 * 1024 * 1024)), app.config["MAX_CONTENT_LENGTH"]
+)
+app.uploads = ChunkedUploads(UPLOAD_FOLDER, app.config["MAX_UPLOAD_FILE_BYTES"], app.config["UPLOAD_CHUNK_BYTES"])
+
+# Configure the background job queue
+app.config["JOB_QUEUE_PATH"] = os.path.join(app.instance_path, "jobs.db")
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 2))
+
+# Configure the result cache for re-uploaded documents
+app.config["RESULT_CACHE_PATH"] = os.path.join(app.instance_path, "results_cache.db")
+app.config["RESULT_CACHE_MAX_BYTES"] = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+app.result_cache = ResultCache(app.config["RESULT_CACHE_PATH"], app.config["RESULT_CACHE_MAX_BYTES"])
+
+# Worker processes write metric snapshots here, /metrics merges them
+app.config["METRICS_PATH"] = os.path.join(app.instance_path, "metrics")
+
 # Register Blueprints
 from routes.upload import upload_bp
 from routes.dashboard import dashboard_bp
 from routes.form import invoice_bp
 from routes.base import base_bp
+from routes.analytics import analytics_bp
+from routes.export import export_bp
+from routes.metrics import metrics_bp
 
 app.register_blueprint(upload_bp)
 app.register_blueprint(dashboard_bp)
 app.register_blueprint(invoice_bp)
 app.register_blueprint(base_bp)
+app.register_blueprint(analytics_bp)
+app.register_blueprint(export_bp)
+app.register_blueprint(metrics_bp)
 
 # Configure logging
 info_logger, error_logger = logging_setup()
@@ -40,7 +72,13 @@ app.info_logger = info_logger
 app.error_logger = error_logger
 
 with app.app_context():
+    configure_engines(db)
     db.create_all()
+    upgrade()
+    ensure_summary()
+
+# Start the OCR workers
+start_workers(app)
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,73 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy import func, cast, Integer, String
+from utils.models import db, Invoice
+from datetime import date
+
+analytics_bp = Blueprint('analytics', __name__)
+
+BUCKETS = ("day", "month", "quarter", "year")
+
+
+def bucket_expression(bucket):
+    """SQL expression labelling each invoice_date with its period"""
+    column = Invoice.invoice_date
+    if db.engine.dialect.name == "postgresql":
+        formats = {"day": "YYYY-MM-DD", "month": "YYYY-MM", "quarter": 'YYYY-"Q"Q', "year": "YYYY"}
+        return func.to_char(column, formats[bucket])
+    if db.engine.dialect.name == "mysql":
+        if bucket == "quarter":
+            return func.concat(func.year(column), "-Q", func.quarter(column))
+        formats = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+        return func.date_format(column, formats[bucket])
+
+    # SQLite stores dates as ISO text
+    if bucket == "quarter":
+        quarter = (cast(func.strftime("%m", column), Integer) + 2) // 3
+        return func.strftime("%Y", column) + "-Q" + cast(quarter, String)
+    formats = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+    return func.strftime(formats[bucket], column)
+
+
+@analytics_bp.route("/api/analytics/timeseries")
+def timeseries():
+    """Invoice counts and amounts per day/month/quarter/year, optionally per supplier or customer"""
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in BUCKETS:
+        return jsonify({'error': f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+
+    period = bucket_expression(bucket).label("period")
+    query = db.session.query(
+        period,
+        func.count(Invoice.id),
+        func.sum(Invoice.total_amount_excluding_tax),
+        func.sum(Invoice.total_sales_tax),
+        func.sum(Invoice.total_amount_including_tax),
+    ).filter(Invoice.invoice_date.is_not(None))
+
+    # Equality on supplier/customer plus the date range uses the composite indexes
+    if request.args.get('supplier'):
+        query = query.filter(Invoice.name == request.args['supplier'])
+    if request.args.get('customer'):
+        query = query.filter(Invoice.customer_name == request.args['customer'])
+    if start:
+        query = query.filter(Invoice.invoice_date >= start)
+    if end:
+        query = query.filter(Invoice.invoice_date <= end)
+
+    rows = query.group_by(period).order_by(period).all()
+    return jsonify({
+        'bucket': bucket,
+        'series': [{
+            'period': period_label,
+            'invoices': count,
+            'total_amount_excluding_tax': excl or 0,
+            'total_sales_tax': sales_tax or 0,
+            'total_amount_including_tax': incl or 0,
+        } for period_label, count, excl, sales_tax, incl in rows],
+    }), 200
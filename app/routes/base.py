@@ -1,39 +1,80 @@
-from flask import Blueprint, request, render_template
-from utils.models import Invoice, Product
-from collections import defaultdict
+from flask import Blueprint, request, render_template, jsonify
+from sqlalchemy import func
+from utils.models import db, Invoice, Product
+from utils.summary import counter_version
+from collections import OrderedDict
+import threading
 
 base_bp = Blueprint('base', __name__)
 
-@base_bp.route("/base")
-def base():
-    name = request.args.get('name')
+# Reports per supplier, keyed by the generation of the supplier's last ingestion
+REPORT_CACHE_SIZE = 256
+_report_cache = OrderedDict()
+_report_cache_lock = threading.Lock()
+
 
-    invoices = Invoice.query.filter_by(name=name).all()
+def supplier_report(name):
+    """Totals and per-product quantities of a supplier, aggregated in SQL"""
+    invoices = [
+        row._asdict() for row in db.session.query(
+            Invoice.date,
+            Invoice.customer_receipt_no,
+            Invoice.total_amount_excluding_tax,
+            Invoice.total_sales_tax,
+            Invoice.total_amount_including_tax,
+        ).filter(Invoice.name == name).order_by(Invoice.id)
+    ]
 
     # Calculate total amounts
-    total_amount_excl_tax = sum(invoice.total_amount_excluding_tax for invoice in invoices)
-    total_sales_tax = sum(invoice.total_sales_tax for invoice in invoices)
+    total_amount_excl_tax, total_sales_tax = db.session.query(
+        func.coalesce(func.sum(Invoice.total_amount_excluding_tax), 0),
+        func.coalesce(func.sum(Invoice.total_sales_tax), 0),
+    ).filter(Invoice.name == name).one()
     total_amount_incl_tax = total_amount_excl_tax + total_sales_tax
 
-    product_quantities = defaultdict(int)
-    unique_products = set()  # store unique product names
-
-    for invoice in invoices:
-        for product in invoice.products:
-            product_quantities[product.product_name] += product.quantity
-            unique_products.add(product.product_name)
-
+    product_quantities = (
+        db.session.query(Product.product_name, func.sum(Product.quantity))
+        .join(Invoice, Product.invoice_id == Invoice.id)
+        .filter(Invoice.name == name)
+        .group_by(Product.product_name)
+        .all()
+    )
     products = [
-        {"product_name": name, "total_quantity": product_quantities[name]}
-        for name in unique_products
+        {"product_name": product_name, "total_quantity": total_quantity}
+        for product_name, total_quantity in product_quantities
     ]
 
-    return render_template(
-        "base.html",
-        name=name,
-        invoices=invoices,
-        total_amount_excl_tax=total_amount_excl_tax,
-        total_amount_incl_tax=total_amount_incl_tax,
-        total_sales_tax=total_sales_tax,
-        products=products
-    )
\ No newline at end of file
+    return {
+        "name": name,
+        "invoices": invoices,
+        "total_amount_excl_tax": total_amount_excl_tax,
+        "total_amount_incl_tax": total_amount_incl_tax,
+        "total_sales_tax": total_sales_tax,
+        "products": products,
+    }
+
+
+def cached_supplier_report(name):
+    # Any ingestion touching this supplier changes its version and so misses the cache
+    key = (name, counter_version("seller", name))
+    with _report_cache_lock:
+        report = _report_cache.get(key)
+        if report is not None:
+            _report_cache.move_to_end(key)
+            return report
+
+    report = supplier_report(name)
+    with _report_cache_lock:
+        _report_cache[key] = report
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+    return report
+
+
+@base_bp.route("/base")
+def base():
+    # Reports are cached per supplier version, a report without a supplier would never be invalidated
+    name = request.args.get('name')
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    return render_template("base.html", **cached_supplier_report(name))
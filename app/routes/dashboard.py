@@ -1,88 +1,216 @@
-from flask import request, g, Blueprint, render_template
-from utils.models import Invoice, Product
-from datetime import datetime
-from utils.pipelline import main
+from flask import request, g, Blueprint, render_template, current_app, jsonify
+from sqlalchemy import func, or_, and_, cast, String
+from sqlalchemy.orm import selectinload
+from utils.models import db, Invoice, Product
+from datetime import datetime, date
+from utils.jobs import queue_depth
+from utils.summary import get_summary
+from routes.analytics import bucket_expression
+import base64
+import json
 
 # Create a Blueprint for dashboard routes
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Columns the invoice API can sort on, nullable ones are coalesced so keyset comparisons hold
+SORT_COLUMNS = {
+    "id": Invoice.id,
+    "name": func.coalesce(Invoice.name, ""),
+    "customer_name": func.coalesce(Invoice.customer_name, ""),
+    # Normalized date, the raw OCR text does not sort chronologically
+    "date": func.coalesce(Invoice.invoice_date, date.min),
+    "total_amount_including_tax": Invoice.total_amount_including_tax,
+}
+
+# Columns matched by the search box
+SEARCH_COLUMNS = [
+    Invoice.name, Invoice.ntn, Invoice.st_reg_no, Invoice.customer_name,
+    Invoice.customer_ntn, Invoice.business_name, cast(Invoice.customer_receipt_no, String),
+]
+
+MAX_PAGE_SIZE = 500
+
+
+def invoice_to_dict(invoice):
+    """Serializes an invoice and its (eagerly loaded) products"""
+    return {
+        "id": invoice.id,
+        "ntn": invoice.ntn,
+        "name": invoice.name,
+        "st_reg_no": invoice.st_reg_no,
+        "address": invoice.address,
+        "customer_receipt_no": invoice.customer_receipt_no,
+        "customer_ntn": invoice.customer_ntn,
+        "customer_name": invoice.customer_name,
+        "customer_st_reg_no": invoice.customer_st_reg_no,
+        "customer_phone_number": invoice.customer_phone_number,
+        "customer_address": invoice.customer_address,
+        "business_name": invoice.business_name,
+        "date": invoice.date,
+        "total_amount_excluding_tax": invoice.total_amount_excluding_tax,
+        "total_sales_tax": invoice.total_sales_tax,
+        "total_amount_including_tax": invoice.total_amount_including_tax,
+        "products": [{
+            "product_name": product.product_name,
+            "quantity": product.quantity,
+            "rate": product.rate,
+            "total_price": product.quantity * product.rate
+        } for product in invoice.products]
+    }
+
+
+def encode_cursor(sort_value, invoice_id):
+    if isinstance(sort_value, date):
+        sort_value = sort_value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([sort_value, invoice_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns the sort value and id of a cursor, raises ValueError for anything encode_cursor cannot produce"""
+    value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(value, list) or len(value) != 2:
+        raise ValueError("Malformed cursor")
+    sort_value, invoice_id = value
+    # Every sort column is non-null, so a cursor never carries None
+    if isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float)):
+        raise ValueError("Malformed cursor")
+    if isinstance(invoice_id, bool) or not isinstance(invoice_id, int):
+        raise ValueError("Malformed cursor")
+    return sort_value, invoice_id
+
+
+def query_invoices(q=None, sort="id", order="asc", cursor=None, limit=50, start=None, end=None):
+    """
+    Fetches one page of invoices with keyset pagination.
+    Args:
+        q (str): Case-insensitive substring matched against the search columns.
+        sort (str): Key of SORT_COLUMNS.
+        order (str): "asc" or "desc".
+        cursor (str): Opaque cursor returned with the previous page.
+        limit (int): Page size, values below 1 are treated as 1.
+        start (date): Earliest invoice date to include.
+        end (date): Latest invoice date to include.
+    Returns:
+        tuple: The invoices of the page and the cursor of the next page, or None.
+    """
+    sort_column = SORT_COLUMNS[sort]
+    limit = max(limit, 1)
+    descending = order == "desc"
+
+    query = Invoice.query.options(selectinload(Invoice.products))
+    if q:
+        pattern = f"%{q}%"
+        query = query.filter(or_(*(column.ilike(pattern) for column in SEARCH_COLUMNS)))
+    if start:
+        query = query.filter(Invoice.invoice_date >= start)
+    if end:
+        query = query.filter(Invoice.invoice_date <= end)
+
+    # Continue strictly after the last row of the previous page
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        if sort == "date":
+            last_value = date.fromisoformat(last_value)
+        if descending:
+            query = query.filter(or_(sort_column < last_value, and_(sort_column == last_value, Invoice.id < last_id)))
+        else:
+            query = query.filter(or_(sort_column > last_value, and_(sort_column == last_value, Invoice.id > last_id)))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Invoice.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Invoice.id.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.with_entities(Invoice, sort_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_invoice, last_value = rows[-1]
+        next_cursor = encode_cursor(last_value, last_invoice.id)
+    return [invoice for invoice, _ in rows], next_cursor
+
+
+def dashboard_charts():
+    """Top sellers and invoices per month, aggregated in SQL"""
+    invoice_count = func.count(Invoice.id)
+    top_sellers = (
+        db.session.query(Invoice.name, invoice_count)
+        .group_by(Invoice.name)
+        .order_by(invoice_count.desc())
+        .limit(10)
+        .all()
+    )
+    month = bucket_expression("month").label("month")
+    invoices_over_time = (
+        db.session.query(month, invoice_count)
+        .filter(Invoice.invoice_date.is_not(None))
+        .group_by(month)
+        .order_by(month)
+        .all()
+    )
+    return {
+        "top_sellers": [[name, count] for name, count in top_sellers],
+        "invoices_over_time": [[period, count] for period, count in invoices_over_time],
+    }
+
+
 @dashboard_bp.route("/dashboard")
 def dashboard():
-    # Run the JSON processing function
-    process_result = main()
-
-    # Pagination setup
-    page = request.args.get('page', 1, type=int)  # Get the current page number
-    per_page = request.args.get('per_page', 10, type=int)  # Number of rows per page
-
-    # Query invoices with pagination
-    paginated_invoices = Invoice.query.paginate(page=page, per_page=per_page, error_out=False)
-
-    # Query all invoices for the entire dataset
-    all_invoices = Invoice.query.all()
-
-    # Create a list of dictionaries for each invoice's products (for paginated data)
-    paginated_invoice_data = []
-    for invoice in paginated_invoices.items:
-        invoice_dict = {
-            "id": invoice.id,
-            "ntn": invoice.ntn,
-            "name": invoice.name,
-            "st_reg_no": invoice.st_reg_no,
-            "address": invoice.address,
-            "customer_receipt_no": invoice.customer_receipt_no,
-            "customer_ntn": invoice.customer_ntn,
-            "customer_name": invoice.customer_name,
-            "customer_st_reg_no": invoice.customer_st_reg_no,
-            "customer_phone_number": invoice.customer_phone_number,
-            "customer_address": invoice.customer_address,
-            "business_name": invoice.business_name,
-            "date": invoice.date,
-            "total_amount_excluding_tax": invoice.total_amount_excluding_tax,
-            "total_sales_tax": invoice.total_sales_tax,
-            "total_amount_including_tax": invoice.total_amount_including_tax,
-            "products": [{
-                "product_name": product.product_name,
-                "quantity": product.quantity,
-                "rate": product.rate,
-                "total_price": product.quantity * product.rate
-            } for product in invoice.products]
-        }
-        paginated_invoice_data.append(invoice_dict)
-
-    # Create a list of dictionaries for all invoices (for the entire dataset)
-    all_invoice_data = []
-    for invoice in all_invoices:
-        invoice_dict = {
-            "id": invoice.id,
-            "ntn": invoice.ntn,
-            "name": invoice.name,
-            "st_reg_no": invoice.st_reg_no,
-            "address": invoice.address,
-            "customer_receipt_no": invoice.customer_receipt_no,
-            "customer_ntn": invoice.customer_ntn,
-            "customer_name": invoice.customer_name,
-            "customer_st_reg_no": invoice.customer_st_reg_no,
-            "customer_phone_number": invoice.customer_phone_number,
-            "customer_address": invoice.customer_address,
-            "business_name": invoice.business_name,
-            "date": invoice.date,
-            "total_amount_excluding_tax": invoice.total_amount_excluding_tax,
-            "total_sales_tax": invoice.total_sales_tax,
-            "total_amount_including_tax": invoice.total_amount_including_tax,
-            "products": [{
-                "product_name": product.product_name,
-                "quantity": product.quantity,
-                "rate": product.rate,
-                "total_price": product.quantity * product.rate
-            } for product in invoice.products]
-        }
-        all_invoice_data.append(invoice_dict)
+    # Documents are processed by the background workers, only report what is pending
+    pending = queue_depth(current_app.config["JOB_QUEUE_PATH"])
+    process_result = f"{pending} document(s) still processing." if pending else None
+
+    # First page is rendered server side, the rest is fetched from /api/invoices
+    per_page = max(1, min(request.args.get('per_page', 10, type=int), MAX_PAGE_SIZE))
+    invoices, next_cursor = query_invoices(limit=per_page)
 
     return render_template(
-        "dashboard.html", 
-        invoices=paginated_invoice_data,  # Paginated data for the table
-        all_invoices=all_invoice_data,    # Entire dataset for JavaScript
-        pagination=paginated_invoices, 
+        "dashboard.html",
+        invoices=[invoice_to_dict(invoice) for invoice in invoices],
+        next_cursor=next_cursor,
+        per_page=per_page,
+        highlights=get_summary(),
+        charts=dashboard_charts(),
         process_result=process_result
-    )
\ No newline at end of file
+    )
+
+
+@dashboard_bp.route("/api/summary")
+def api_summary():
+    """Dashboard highlights, maintained at ingestion time"""
+    return jsonify(get_summary()), 200
+
+
+@dashboard_bp.route("/api/invoices")
+def api_invoices():
+    """Keyset-paginated, filterable and sortable invoice listing"""
+    sort = request.args.get('sort', 'id')
+    order = request.args.get('order', 'asc')
+    if sort not in SORT_COLUMNS or order not in ("asc", "desc"):
+        return jsonify({'error': 'Invalid sort or order'}), 400
+
+    limit = max(1, min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE))
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+
+    try:
+        invoices, next_cursor = query_invoices(
+            q=request.args.get('q', '').strip() or None,
+            sort=sort,
+            order=order,
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            start=start,
+            end=end,
+        )
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    return jsonify({
+        'items': [invoice_to_dict(invoice) for invoice in invoices],
+        'next_cursor': next_cursor,
+    }), 200
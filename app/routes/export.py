@@ -0,0 +1,29 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from utils.invoice_export import iter_invoices, render_parallel, stream_zip
+from datetime import date, datetime
+
+export_bp = Blueprint('export', __name__)
+
+
+@export_bp.route("/export/invoices.zip")
+def export_invoices():
+    """Stored invoices rendered as PDFs, streamed as a ZIP while they are rendered"""
+    try:
+        ids = [int(i) for i in request.args['ids'].split(',')] if request.args.get('ids') else None
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'ids must be comma separated integers, start and end YYYY-MM-DD dates'}), 400
+
+    invoices = iter_invoices(
+        ids=ids,
+        supplier=request.args.get('supplier'),
+        customer=request.args.get('customer'),
+        start=start,
+        end=end,
+    )
+    # The request context stays open while the archive streams, the rows are read batch by batch
+    archive = stream_with_context(stream_zip(render_parallel(invoices)))
+    filename = f"invoices_{datetime.now():%Y%m%d_%H%M%S}.zip"
+    return Response(archive, mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
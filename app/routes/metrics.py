@@ -0,0 +1,18 @@
+from flask import Blueprint, Response, current_app
+from utils.jobs import queue_depth
+from utils import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route("/metrics")
+def prometheus_metrics():
+    """Pipeline metrics of the web process and all workers, in Prometheus text format"""
+    gauges = {
+        "cvip_job_queue_depth": (
+            "Jobs queued, running or waiting to be stored.",
+            queue_depth(current_app.config["JOB_QUEUE_PATH"]),
+        ),
+    }
+    body = metrics.render(current_app.config["METRICS_PATH"], gauges)
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
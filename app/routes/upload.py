@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify, render_template, current_app
 from datetime import datetime
+from utils.jobs import enqueue, get_job
+from utils.uploads import save_stream, unique_file_path, UploadError
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 
 # Create a Blueprint for upload routes
@@ -20,22 +23,98 @@ def index():
 
         files = request.files.getlist('files')
         file_paths = []
+        job_ids = []
 
         for file in files:
             if file.filename == '':
                 continue
 
-            # Save the file to the uploads folder
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
+            # Save the file to the uploads folder under a unique name
             try:
-                file.save(file_path)
+                file_path = unique_file_path(current_app.config['UPLOAD_FOLDER'], file.filename)
+                content_hash, _ = save_stream(
+                    file.stream, file_path, max_bytes=current_app.config['MAX_UPLOAD_FILE_BYTES']
+                )
                 file_paths.append(file_path)
-                info_logger.info(f"File uploaded successfully: {file.filename}")  # Log the success
+                document = os.path.basename(file_path)  # Workers log the same document name
+                info_logger.info(f"File uploaded successfully: {file.filename}", extra={"document": document})
+
+                # Hand the file to the background workers
+                job_id = enqueue(current_app.config['JOB_QUEUE_PATH'], file_path, content_hash)
+                job_ids.append(job_id)
+                info_logger.info(f"Queued job {job_id} for {file.filename}", extra={"document": document, "job_id": job_id})
+            except UploadError as e:
+                error_message = f"Rejected file {file.filename}: {e}"
+                error_logger.error(error_message)  # Log the error
+                return jsonify({'error': error_message}), e.status
             except Exception as e:
                 error_message = f"Failed to save file {file.filename}: {e}"
                 error_logger.error(error_message)  # Log the error
                 return jsonify({'error': error_message}), 500
 
-        return jsonify({'message': 'Files uploaded successfully', 'file_paths': file_paths}), 200
+        return jsonify({'message': 'Files uploaded successfully', 'file_paths': file_paths, 'job_ids': job_ids}), 200
     else:
-        return render_template('upload.html')
\ No newline at end of file
+        return render_template('upload.html')
+
+
+@upload_bp.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f"Request exceeds the limit of {limit} bytes, use /uploads/init for large files"}), 413
+
+
+@upload_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+
+# Resumable uploads: init, then append byte ranges in order, then complete
+@upload_bp.route('/uploads/init', methods=["POST"])
+def upload_init():
+    """Declares a file, answers with its upload id and the chunk size to use"""
+    data = request.get_json(silent=True) or {}
+    status = current_app.uploads.init(data.get('filename'), data.get('size'))
+    current_app.info_logger.info(f"Upload {status['upload_id']} started: {status['filename']} ({status['size']} bytes)")
+    return jsonify(status), 201
+
+
+@upload_bp.route('/uploads/<upload_id>')
+def upload_status(upload_id):
+    """Bytes received so far, clients resume from `offset`"""
+    return jsonify(current_app.uploads.status(upload_id)), 200
+
+
+@upload_bp.route('/uploads/<upload_id>/append', methods=["PUT"])
+def upload_append(upload_id):
+    """Writes the raw request body at ?offset= of the upload"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'offset is required'}), 400
+    return jsonify(current_app.uploads.append(upload_id, offset, request.stream)), 200
+
+
+@upload_bp.route('/uploads/<upload_id>/complete', methods=["POST"])
+def upload_complete(upload_id):
+    """Finishes an upload and queues the file for processing"""
+    data = request.get_json(silent=True) or {}
+    file_id, file_path, content_hash = current_app.uploads.complete(upload_id, data.get('sha256'))
+
+    job_id = enqueue(current_app.config['JOB_QUEUE_PATH'], file_path, content_hash)
+    current_app.info_logger.info(f"Upload {upload_id} complete as {file_id}, queued job {job_id}",
+                                 extra={"document": os.path.basename(file_path), "job_id": job_id})
+    return jsonify({'file_id': file_id, 'content_hash': content_hash, 'job_id': job_id}), 200
+
+
+@upload_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status and page progress of a queued document"""
+    job = get_job(current_app.config['JOB_QUEUE_PATH'], job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+
+@upload_bp.route('/jobs/cache')
+def cache_stats():
+    """Hit/miss counters of the document result cache"""
+    return jsonify(current_app.result_cache.stats()), 200
@@ -72,6 +72,47 @@ function removeFile(file) {
   uploadedFiles = uploadedFiles.filter((f) => f !== file);
 }
 
+// Send one byte range, retrying from the server's offset when the link drops
+async function sendChunk(upload, file, offset, attempts = 5) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const end = Math.min(offset + upload.chunk_size, file.size);
+      const response = await fetch(`/uploads/${upload.upload_id}/append?offset=${offset}`, {
+        method: "PUT",
+        body: file.slice(offset, end),
+      });
+      if (response.ok) return (await response.json()).offset;
+      if (response.status !== 409) throw new Error((await response.json()).error);
+    } catch (error) {
+      if (attempt >= attempts) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+    }
+    // Ask where the server stands and continue from there
+    const status = await fetch(`/uploads/${upload.upload_id}`);
+    if (status.ok) offset = (await status.json()).offset;
+  }
+}
+
+// Upload a single file in chunks, returns its job id
+async function uploadFile(file) {
+  const init = await fetch("/uploads/init", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  if (!init.ok) throw new Error((await init.json()).error);
+  const upload = await init.json();
+
+  let offset = upload.offset;
+  while (offset < file.size) {
+    offset = await sendChunk(upload, file, offset);
+  }
+
+  const complete = await fetch(`/uploads/${upload.upload_id}/complete`, { method: "POST" });
+  if (!complete.ok) throw new Error((await complete.json()).error);
+  return (await complete.json()).job_id;
+}
+
 // Upload files to the backend
 async function uploadFiles() {
   if (uploadedFiles.length === 0) {
@@ -79,27 +120,16 @@ async function uploadFiles() {
     return;
   }
 
-  const formData = new FormData();
-  for (const file of uploadedFiles) {
-    formData.append("files", file);
-  }
-
   try {
-    const response = await fetch("/", {
-      method: "POST",
-      body: formData,
-    });
-
-    if (response.ok) {
-      alert("Files uploaded successfully!");
-      let uploadedFiles = [];
-      window.location.href = "/dashboard";
-    } else {
-      alert("Failed to upload files.");
+    for (const file of uploadedFiles) {
+      await uploadFile(file);
     }
+    alert("Files uploaded successfully!");
+    uploadedFiles = [];
+    window.location.href = "/dashboard";
   } catch (error) {
     console.error("Error uploading files:", error);
-    alert("An error occurred while uploading files.");
+    alert(`Failed to upload files: ${error.message}`);
   }
 }
 
@@ -0,0 +1,48 @@
+import os
+import pytest
+from flask import Flask
+from utils.models import db, Invoice
+from utils.storage import database_config, configure_engines
+from utils.summary import ensure_summary
+from utils.jobs import connect
+from routes.dashboard import dashboard_bp, query_invoices
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_app(tmp_path, invoices=0):
+    app = Flask(__name__, root_path=APP_DIR)
+    app.config.update(database_config(f"sqlite:///{tmp_path / 'database.db'}"))
+    app.config["JOB_QUEUE_PATH"] = str(tmp_path / "jobs.db")
+    db.init_app(app)
+    app.register_blueprint(dashboard_bp)
+    connect(app.config["JOB_QUEUE_PATH"]).close()
+    with app.app_context():
+        configure_engines(db)
+        db.create_all()
+        ensure_summary()
+        db.session.add_all(Invoice(
+            ntn="1234567-8", name=f"Seller {i}", st_reg_no="17-00-0000-000-00", address="Lahore",
+            customer_receipt_no=i, customer_ntn="7654321-0", customer_name="Customer", customer_st_reg_no="-",
+            customer_phone_number="0300-0000000", customer_address="Karachi", business_name="Business",
+            date="01/01/2024", total_amount_excluding_tax=100.0, total_sales_tax=18.0,
+            total_amount_including_tax=118.0,
+        ) for i in range(invoices))
+        db.session.commit()
+    return app
+
+
+@pytest.mark.parametrize("invoices", [0, 3])
+@pytest.mark.parametrize("per_page", [0, -3])
+def test_dashboard_clamps_per_page(tmp_path, invoices, per_page):
+    client = make_app(tmp_path, invoices).test_client()
+    assert client.get(f"/dashboard?per_page={per_page}").status_code == 200
+
+
+def test_query_invoices_treats_small_limits_as_one(tmp_path):
+    app = make_app(tmp_path, invoices=3)
+    with app.app_context():
+        for limit in (0, -3):
+            invoices, next_cursor = query_invoices(limit=limit)
+            assert len(invoices) == 1
+            assert next_cursor is not None
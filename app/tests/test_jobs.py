@@ -0,0 +1,52 @@
+import os
+import json
+import numpy as np
+import pytest
+from utils import pipelline
+from utils.jobs import connect, enqueue, get_job, process_job
+from utils.model_registry import registry
+from utils.result_cache import ResultCache
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    """Stands in for rasterization, detection and OCR: every page yields {"page": <its name>}."""
+    def iter_pdf_pages(pdf_path, *args, **kwargs):
+        yield 1, 1, np.zeros((8, 8, 3), np.uint8)
+
+    def process_batch(pages, output_folder, model=None):
+        json_paths = []
+        for name, _ in pages:
+            json_path = os.path.join(output_folder, f"{name}__ocr.json")
+            with open(json_path, "w") as f:
+                json.dump({"page": name}, f)
+            json_paths.append(json_path)
+        return json_paths
+
+    monkeypatch.setattr(pipelline, "iter_pdf_pages", iter_pdf_pages)
+    monkeypatch.setattr(pipelline, "process_batch", process_batch)
+    monkeypatch.setattr(pipelline.cv2, "imread", lambda path: np.zeros((8, 8, 3), np.uint8))
+    monkeypatch.setattr(registry, "version", lambda model_path: "test-model")
+
+
+@pytest.mark.parametrize("file_name", ["invoice.pdf", "invoice.png"])
+def test_cache_hit_writes_the_names_of_a_fresh_run(tmp_path, monkeypatch, fake_pipeline, file_name):
+    monkeypatch.chdir(tmp_path)
+    queue_path = str(tmp_path / "jobs.db")
+    cache = ResultCache(str(tmp_path / "results_cache.db"))
+
+    def run():
+        # process_job deletes the upload, each run gets its own copy
+        file_path = str(tmp_path / file_name)
+        with open(file_path, "wb") as f:
+            f.write(b"same bytes")
+        job = get_job(queue_path, enqueue(queue_path, file_path, content_hash="abc"))
+        conn = connect(queue_path)
+        try:
+            return [os.path.basename(path) for path in process_job(job, conn, cache)]
+        finally:
+            conn.close()
+
+    fresh = run()
+    assert cache.get("abc", "test-model", pipelline.extraction_settings()) is not None
+    assert run() == fresh
@@ -0,0 +1,536 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+from utils import pipelline, yolo, onnx_engine, metrics
+from utils.onnx_engine import CLASS_NAMES
+from utils.model_registry import registry, model_version
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+# Relative change tolerated before a run counts as a regression
+LATENCY_THRESHOLD = 0.25
+THROUGHPUT_THRESHOLD = 0.15
+RSS_THRESHOLD = 0.25
+
+# Stages faster than this at p95 are dominated by noise and not compared
+MIN_COMPARED_SECONDS = 0.002
+
+# Stages process_batch times once per detection batch, charged evenly to its pages
+BATCH_STAGES = ("inference", "ocr")
+
+
+class StageTimer:
+    """Raw durations per stage, kept so percentiles are exact."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage, seconds, count=1):
+        # Work done for `count` pages at once is charged to each of them evenly
+        self.samples.setdefault(stage, []).extend([seconds / count] * count)
+
+    @contextmanager
+    def __call__(self, stage, count=1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, count)
+
+    def update(self, samples):
+        for stage, values in samples.items():
+            self.samples.setdefault(stage, []).extend(values)
+
+    def summary(self):
+        return {
+            stage: {
+                "count": len(values),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "mean": float(np.mean(values)),
+            }
+            for stage, values in sorted(self.samples.items())
+        }
+
+
+def peak_rss_mb():
+    """Peak resident set size of the calling process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Stand-in detectors, used when no trained model is available
+
+
+def stand_in_onnx(path, seed=0, size=640):
+    """
+    Writes a randomly initialised detector with the input and output layout of
+    a YOLOv8 export (1x3x640x640 in, 4 + classes x 6400 anchors out).
+    It finds meaningless boxes and is lighter than the real network, so its
+    numbers only compare against baselines recorded with the same stand-in.
+    """
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+
+    rng = np.random.default_rng(seed)
+    classes = len(CLASS_NAMES)
+    nodes, initializers = [], []
+    channels = [3, 16, 32, 64]
+    previous = "images"
+    for i, (c_in, c_out) in enumerate(zip(channels, channels[1:])):
+        weight = rng.normal(0, (2 / (9 * c_in)) ** 0.5, (c_out, c_in, 3, 3)).astype(np.float32)
+        initializers.append(numpy_helper.from_array(weight, f"w{i}"))
+        nodes.append(helper.make_node("Conv", [previous, f"w{i}"], [f"conv{i}"], strides=[2, 2], pads=[1, 1, 1, 1]))
+        nodes.append(helper.make_node("Relu", [f"conv{i}"], [f"relu{i}"]))
+        previous = f"relu{i}"
+
+    # Head: boxes centred anywhere on the input and up to a fifth of its side, few confident classes
+    head = rng.normal(0, 0.1, (4 + classes, channels[-1], 1, 1)).astype(np.float32)
+    bias = np.concatenate([np.zeros(4), np.full(classes, -3.0)]).astype(np.float32)
+    scale = np.concatenate([[size, size, size / 5, size / 5], np.ones(classes)]).astype(np.float32)
+    initializers += [
+        numpy_helper.from_array(head, "head"),
+        numpy_helper.from_array(bias, "head_bias"),
+        numpy_helper.from_array(scale.reshape(1, -1, 1), "scale"),
+        numpy_helper.from_array(np.array([0, 4 + classes, -1], dtype=np.int64), "shape"),
+    ]
+    nodes += [
+        helper.make_node("Conv", [previous, "head", "head_bias"], ["head_out"]),
+        helper.make_node("Reshape", ["head_out", "shape"], ["flat"]),
+        helper.make_node("Sigmoid", ["flat"], ["sigmoid"]),
+        helper.make_node("Mul", ["sigmoid", "scale"], ["output0"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "stand_in",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, size, size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", 4 + classes, None])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.helper.set_model_props(model, {"names": str(dict(enumerate(CLASS_NAMES)))})
+    onnx.save(model, path)
+    return path
+
+
+def stand_in_pt(path):
+    """Writes an untrained YOLOv8n checkpoint, ultralytics builds it from its bundled config."""
+    from ultralytics import YOLO
+
+    YOLO("yolov8n.yaml").save(path)
+    return path
+
+
+def resolve_models(backends, work_dir, pt_model="model/best.pt", onnx_model="model/best.onnx"):
+    """
+    Picks the model of every backend, trained weights when present and a stand-in otherwise.
+    Returns:
+        tuple: {backend: (path, stand_in)} and {backend: reason} for backends that cannot run.
+    """
+    models, skipped = {}, {}
+    for backend in backends:
+        path = pt_model if backend == "pt" else onnx_model
+        if os.path.exists(path):
+            models[backend] = (path, False)
+            continue
+        try:
+            if backend == "pt":
+                if pipelline.YOLO is None:
+                    raise ImportError("ultralytics is not installed")
+                models[backend] = (stand_in_pt(os.path.join(work_dir, "stand_in.pt")), True)
+            else:
+                models[backend] = (stand_in_onnx(os.path.join(work_dir, "stand_in.onnx")), True)
+        except Exception as e:
+            skipped[backend] = f"{path} not found and no stand-in could be built: {e}"
+    return models, skipped
+
+
+# Inputs
+
+
+def sample_images(samples_dir=SAMPLES_DIR):
+    return sorted(
+        os.path.join(samples_dir, name) for name in os.listdir(samples_dir)
+        if name.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+
+
+def synthetic_pdfs(images, work_dir, count=2, pages=4, dpi=300):
+    """Builds multi-page PDFs by cycling through the sample images, the same files on every run."""
+    paths = []
+    for i in range(count):
+        frames = [Image.open(images[(i * pages + page) % len(images)]).convert("RGB") for page in range(pages)]
+        path = os.path.join(work_dir, f"synthetic_{i + 1}.pdf")
+        frames[0].save(path, save_all=True, append_images=frames[1:], resolution=dpi)
+        paths.append(path)
+    return paths
+
+
+# Worker side
+
+
+def _no_ocr_crop(preprocessed, label):
+    return ""
+
+
+def _no_ocr_mosaic(crops, config=None, lang=None):
+    return [""] * len(crops)
+
+
+def _init_worker(model_path, ocr=True):
+    registry.get(model_path)  # Loaded once per worker, outside the timed documents
+    if not ocr:
+        # Without tesseract the crops are still preprocessed, only the tesseract calls are skipped
+        pipelline.ocr_crop = _no_ocr_crop
+        pipelline.ocr_mosaic = _no_ocr_mosaic
+
+
+def _worker_ready(delay=0.2):
+    time.sleep(delay)  # Holds the worker so the other ready calls land on the other workers
+    return os.getpid()
+
+
+def _process_pages(pages, model_path, output_folder, timer):
+    """
+    Runs the pages through `pipelline.process_batch` and records the stage
+    latencies it reports to the metrics registry.
+    Returns:
+        int: Boxes detected on the pages.
+    """
+    observed, boxes = [], []
+
+    def listener(name, value, labels):
+        if name == "cvip_stage_seconds":
+            observed.append((labels["stage"], value))
+        elif name == "cvip_boxes_per_page":
+            boxes.append(value)
+
+    metrics.registry.add_listener(listener)
+    try:
+        pipelline.process_batch(pages, output_folder, model_path)
+    finally:
+        metrics.registry.remove_listener(listener)
+
+    for stage, seconds in observed:
+        timer.record(stage, seconds, len(pages) if stage in BATCH_STAGES else 1)
+    return int(sum(boxes))
+
+
+def run_document(path, model_path, output_folder):
+    """
+    Runs one image or PDF through the stages of `pipelline.process_file`,
+    timing each of them. Input files are left in place.
+    Returns:
+        tuple: Stage samples, pages, boxes and the worker's peak RSS in MB.
+    """
+    timer = StageTimer()
+    name = os.path.splitext(os.path.basename(path))[0]
+    pages_done = boxes = 0
+    started = time.perf_counter()
+
+    if path.lower().endswith(".pdf"):
+        pages = pipelline.iter_pdf_pages(path)
+        batch = []
+        rasterize, window_pages = 0.0, 0
+        while True:
+            fetch_started = time.perf_counter()
+            item = next(pages, None)
+            rasterize += time.perf_counter() - fetch_started
+            if item is None:
+                break
+            page_number, page_count, image = item
+            window_pages += 1
+            # Poppler renders a window of pages per call, its cost is spread over them
+            if window_pages == pipelline.PDF_PAGE_WINDOW or page_number == page_count:
+                timer.record("pdf_rasterize", rasterize, window_pages)
+                rasterize, window_pages = 0.0, 0
+            batch.append((f"{name}_{page_number}", image))
+            if len(batch) == pipelline.DETECT_BATCH_SIZE or page_number == page_count:
+                boxes += _process_pages(batch, model_path, output_folder, timer)
+                pages_done += len(batch)
+                batch = []
+    else:
+        with timer("image_decode"):
+            image = pipelline.load_image(path)
+        boxes += _process_pages([(name, image)], model_path, output_folder, timer)
+        pages_done += 1
+
+    timer.record("document", time.perf_counter() - started)
+    return timer.samples, pages_done, boxes, peak_rss_mb()
+
+
+# Runs
+
+
+def run_pipeline(documents, model_path, workers, output_folder, ocr):
+    """
+    Processes every document with a fresh pool of `workers` processes.
+    Returns:
+        dict: Throughput, peak RSS and per-stage latency of the run.
+    """
+    timer = StageTimer()
+    pages = boxes = 0
+    peak_rss = 0.0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path, ocr)) as pool:
+        # Start every worker and load its model before the clock starts
+        ready = set()
+        for _ in range(3):
+            ready.update(pool.map(_worker_ready, [0.2] * workers))
+            if len(ready) >= workers:
+                break
+
+        started = time.perf_counter()
+        futures = [pool.submit(run_document, path, model_path, output_folder) for path in documents]
+        for future in futures:
+            samples, doc_pages, doc_boxes, rss = future.result()
+            timer.update(samples)
+            pages += doc_pages
+            boxes += doc_boxes
+            peak_rss = max(peak_rss, rss)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "workers": workers,
+        "documents": len(documents),
+        "pages": pages,
+        "boxes_per_page": boxes / max(pages, 1),
+        "seconds": elapsed,
+        "pages_per_second": pages / max(elapsed, 1e-9),
+        "peak_rss_mb": peak_rss,
+        "stages": timer.summary(),
+    }
+
+
+def run_standalone(backend, model_path, images, repeat):
+    """
+    Times detection alone on each sample image: the `utils.yolo` script for
+    .pt models, the production `onnx_engine` path for ONNX models.
+    """
+    timer = StageTimer()
+    if backend == "pt":
+        with timer("model_load"):
+            model = yolo.load_pt_model(model_path)
+        for _ in range(repeat):
+            for image_path in images:
+                with timer("yolo_forward"):
+                    results = yolo.run_inference_pt(model, image_path)
+                with timer("yolo_postprocess"):
+                    yolo.postprocess_output_pt(results)
+        return {"stages": timer.summary(), "peak_rss_mb": peak_rss_mb()}
+
+    with timer("model_load"):
+        session = onnx_engine.create_session(
+            model_path, pipelline.ONNX_INTRA_OP_THREADS, pipelline.ONNX_GRAPH_OPTIMIZATION
+        )
+    shape = onnx_engine.input_shape(session)
+    views = [pipelline.detection_view(cv2.imread(image_path))[0] for image_path in images]
+    for _ in range(repeat):
+        for view in views:
+            with timer("onnx_letterbox"):
+                onnx_engine.letterbox(view, shape)
+            with timer("onnx_detect"):
+                onnx_engine.detect_batch(session, [view])
+    return {"stages": timer.summary(), "peak_rss_mb": peak_rss_mb()}
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "onnxruntime": ort.__version__,
+        "opencv": cv2.__version__,
+        "detect_batch_size": pipelline.DETECT_BATCH_SIZE,
+        "detect_max_side": pipelline.DETECT_MAX_SIDE,
+        "ocr_mode": pipelline.OCR_MODE,
+        "ocr_workers": pipelline.OCR_WORKERS,
+        "onnx_intra_op_threads": pipelline.ONNX_INTRA_OP_THREADS,
+        "pdf_dpi": pipelline.PDF_DPI,
+        "pdf_page_window": pipelline.PDF_PAGE_WINDOW,
+    }
+
+
+def run_benchmark(backends=("pt", "onnx"), worker_counts=(1, 2), repeat=3, pdfs=2, pdf_pages=4,
+                  pt_model="model/best.pt", onnx_model="model/best.onnx", ocr=None, samples_dir=SAMPLES_DIR):
+    """
+    Runs the sample images and synthetic PDFs through every backend and worker count.
+    Args:
+        backends (tuple): "pt" and/or "onnx".
+        worker_counts (tuple): Pool sizes to measure.
+        repeat (int): Passes over the inputs per run.
+        pdfs (int): Synthetic PDFs to build.
+        pdf_pages (int): Pages per synthetic PDF.
+        pt_model (str): Trained .pt weights, a stand-in is used when missing.
+        onnx_model (str): Trained .onnx model, a stand-in is used when missing.
+        ocr (bool): Run tesseract, None runs it when it is installed.
+        samples_dir (str): Folder with the sample invoice images.
+    Returns:
+        dict: The results, ready to be saved as a baseline.
+    """
+    skipped = {}
+    if ocr is None:
+        ocr = shutil.which(pipelline.pytesseract.pytesseract.tesseract_cmd) is not None
+        if not ocr:
+            skipped["ocr"] = "tesseract not found, crops are preprocessed but not recognised"
+
+    work_dir = tempfile.mkdtemp(prefix="cvip_benchmark_")
+    try:
+        images = sample_images(samples_dir)
+        documents = list(images)
+        if pdfs and shutil.which("pdftoppm"):
+            documents += synthetic_pdfs(images, work_dir, pdfs, pdf_pages)
+        elif pdfs:
+            skipped["pdf"] = "poppler (pdftoppm) not found, synthetic PDFs are not rasterized"
+        documents = documents * repeat
+
+        models, skipped_models = resolve_models(backends, work_dir, pt_model, onnx_model)
+        skipped.update(skipped_models)
+        output_folder = os.path.join(work_dir, "json")
+        os.makedirs(output_folder)
+
+        runs = {}
+        for backend, (model_path, stand_in) in models.items():
+            model = {"model": model_path, "model_version": model_version(model_path), "stand_in": stand_in}
+            for workers in worker_counts:
+                print(f"Benchmarking {backend} with {workers} worker(s)...", file=sys.stderr)
+                runs[f"{backend}/workers={workers}"] = dict(
+                    backend=backend, **model, **run_pipeline(documents, model_path, workers, output_folder, ocr)
+                )
+            runs[f"{backend}/standalone"] = dict(
+                backend=backend, **model, **run_standalone(backend, model_path, images, repeat)
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {"repeat": repeat, "images": len(images), "pdfs": pdfs, "pdf_pages": pdf_pages, "ocr": ocr},
+        "runs": runs,
+        "skipped": skipped,
+    }
+
+
+def compare(current, baseline, latency_threshold=LATENCY_THRESHOLD,
+            throughput_threshold=THROUGHPUT_THRESHOLD, rss_threshold=RSS_THRESHOLD):
+    """
+    Compares a run against a saved baseline.
+    Args:
+        current (dict): Results of `run_benchmark`.
+        baseline (dict): Results loaded from a baseline file.
+        latency_threshold (float): Tolerated relative growth of a stage's p95.
+        throughput_threshold (float): Tolerated relative drop of pages per second.
+        rss_threshold (float): Tolerated relative growth of the peak RSS.
+    Returns:
+        tuple: Regressions and notes, both lists of messages.
+    """
+    regressions, notes = [], []
+    for key, run in current["runs"].items():
+        base = baseline.get("runs", {}).get(key)
+        if base is None:
+            notes.append(f"{key}: not in the baseline")
+            continue
+        if base.get("model_version") != run.get("model_version"):
+            notes.append(f"{key}: model changed ({base.get('model_version')} -> {run.get('model_version')})")
+
+        if "pages_per_second" in run and "pages_per_second" in base:
+            if run["pages_per_second"] < base["pages_per_second"] * (1 - throughput_threshold):
+                regressions.append(
+                    f"{key}: throughput {run['pages_per_second']:.2f} pages/s, "
+                    f"baseline {base['pages_per_second']:.2f}"
+                )
+        if run["peak_rss_mb"] > base["peak_rss_mb"] * (1 + rss_threshold):
+            regressions.append(f"{key}: peak RSS {run['peak_rss_mb']:.0f} MB, baseline {base['peak_rss_mb']:.0f} MB")
+
+        for stage, stats in run["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats is None or base_stats["p95"] < MIN_COMPARED_SECONDS:
+                continue
+            if stats["p95"] > base_stats["p95"] * (1 + latency_threshold):
+                regressions.append(
+                    f"{key}: {stage} p95 {stats['p95'] * 1000:.1f} ms, baseline {base_stats['p95'] * 1000:.1f} ms"
+                )
+    return regressions, notes
+
+
+def report(results):
+    """Prints the results as a table."""
+    for key, run in results["runs"].items():
+        header = f"{key} ({os.path.basename(run['model'])}{', stand-in' if run['stand_in'] else ''})"
+        if "pages_per_second" in run:
+            header += (f": {run['pages']} pages in {run['seconds']:.2f}s, {run['pages_per_second']:.2f} pages/s, "
+                       f"{run['boxes_per_page']:.1f} boxes/page")
+        print(f"{header}, peak RSS {run['peak_rss_mb']:.0f} MB")
+        for stage, stats in run["stages"].items():
+            print(f"  {stage:<18} p50 {stats['p50'] * 1000:9.2f} ms   p95 {stats['p95'] * 1000:9.2f} ms   n={stats['count']}")
+    for what, reason in results["skipped"].items():
+        print(f"Skipped {what}: {reason}")
+
+
+def main():
+    """Benchmarks the extraction pipeline, e.g. `python -m utils.benchmark --save benchmarks/baseline.json`."""
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline")
+    parser.add_argument("--backends", default="pt,onnx", help="Comma separated backends: pt, onnx")
+    parser.add_argument("--workers", default="1,2", help="Comma separated worker counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the inputs per run")
+    parser.add_argument("--pdfs", type=int, default=2, help="Synthetic PDFs to build, 0 for images only")
+    parser.add_argument("--pdf-pages", type=int, default=4, help="Pages per synthetic PDF")
+    parser.add_argument("--pt-model", default="model/best.pt", help="Trained .pt weights")
+    parser.add_argument("--onnx-model", default="model/best.onnx", help="Trained .onnx model")
+    parser.add_argument("--skip-ocr", action="store_true", help="Do not run tesseract")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against this JSON file, exit 1 on regressions")
+    parser.add_argument("--latency-threshold", type=float, default=LATENCY_THRESHOLD)
+    parser.add_argument("--throughput-threshold", type=float, default=THROUGHPUT_THRESHOLD)
+    parser.add_argument("--rss-threshold", type=float, default=RSS_THRESHOLD)
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        backends=tuple(args.backends.split(",")),
+        worker_counts=tuple(int(n) for n in args.workers.split(",")),
+        repeat=args.repeat,
+        pdfs=args.pdfs,
+        pdf_pages=args.pdf_pages,
+        pt_model=args.pt_model,
+        onnx_model=args.onnx_model,
+        ocr=False if args.skip_ocr else None,
+    )
+    report(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, notes = compare(
+            results, baseline, args.latency_threshold, args.throughput_threshold, args.rss_threshold
+        )
+        for note in notes:
+            print(f"Note: {note}")
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
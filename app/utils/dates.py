@@ -0,0 +1,48 @@
+import re
+from datetime import datetime, date
+
+# Numeric dates as printed on the invoices, day first
+NUMERIC_DATE = re.compile(r"(\d{1,4})\s*[-/.]\s*(\d{1,2})\s*[-/.]\s*(\d{2,4})")
+
+# Dates with a month name, e.g. "28 Jun 2023" or "June 28, 2023"
+TEXT_FORMATS = ["%d %b %Y", "%d %B %Y", "%b %d %Y", "%B %d %Y"]
+TEXT_DATE = re.compile(r"(\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4}|[A-Za-z]{3,9}\s+\d{1,2}\s+\d{4})")
+
+
+def parse_invoice_date(raw):
+    """
+    Normalizes a date string produced by OCR or the CSV import.
+    Args:
+        raw (str): Raw date text, e.g. "28-06-2023" or "Date: 28/06/23".
+    Returns:
+        date: The parsed date, or None if no valid date is found.
+    """
+    if isinstance(raw, date):
+        return raw
+    if not isinstance(raw, str) or not raw.strip():
+        return None
+
+    match = NUMERIC_DATE.search(raw)
+    if match:
+        first, month, last = match.groups()
+        if len(first) == 4:
+            year, day = first, last
+        else:
+            day, year = first, last
+        year = int(year)
+        if year < 100:
+            year += 2000
+        try:
+            return date(year, int(month), int(day))
+        except ValueError:
+            return None
+
+    match = TEXT_DATE.search(raw.replace(",", " "))
+    if match:
+        text = " ".join(match.group(1).split())
+        for fmt in TEXT_FORMATS:
+            try:
+                return datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+    return None
@@ -0,0 +1,237 @@
+import os
+import sys
+import time
+import zipfile
+import argparse
+import threading
+import multiprocessing
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from utils.models import db, Invoice
+from utils.invoice_pdf import render_invoice
+from utils.logs import logging_setup, log_queue
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", os.cpu_count() or 2))
+
+# Invoices loaded from the database per query
+EXPORT_BATCH_SIZE = 200
+
+_export_pool = None
+_export_pool_lock = threading.Lock()
+
+
+def _init_export_worker(queue):
+    # Spawned children do not inherit the log queue, log through the parent's listener
+    if queue is not None:
+        logging_setup(queue)
+
+
+def export_pool(max_workers):
+    """
+    Starts a pool of rendering processes.
+    Spawned rather than forked: the web process runs the log listener, the
+    job supervisor and OCR threads, and a fork taken while one of them holds
+    a lock leaves the child deadlocked.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_export_worker, initargs=(log_queue(),),
+    )
+
+
+def get_export_pool():
+    """Process pool shared by all exports, started on first use."""
+    global _export_pool
+    if _export_pool is None:
+        with _export_pool_lock:
+            if _export_pool is None:
+                _export_pool = export_pool(EXPORT_WORKERS)
+    return _export_pool
+
+
+def _amount(value):
+    return f"{value:,.2f}" if value is not None else ""
+
+
+def invoice_fields(invoice):
+    """Maps a stored invoice onto the fields of the /form invoice layout."""
+    return {
+        "supplier_name": invoice.name,
+        "supplier_address": invoice.address,
+        "supplier_st_no": invoice.st_reg_no,
+        "supplier_ntn": invoice.ntn,
+        "buyer_name": invoice.customer_name,
+        "buyer_address": invoice.customer_address,
+        "buyer_st_no": invoice.customer_st_reg_no,
+        "buyer_ntn": invoice.customer_ntn,
+        "buyer_contact": invoice.customer_phone_number,
+        "business_name": invoice.business_name,
+        "serial_number": invoice.customer_receipt_no,
+        "invoice_date": invoice.invoice_date.strftime("%d-%m-%Y") if invoice.invoice_date else invoice.date,
+        "total_ex_tax": _amount(invoice.total_amount_excluding_tax),
+        "total_sales_tax": _amount(invoice.total_sales_tax),
+        "total_in_tax": _amount(invoice.total_amount_including_tax),
+        "products": [{
+            "description": product.product_name,
+            "quantity": product.quantity,
+            "rate": product.rate,
+            "amount_ex_tax": product.amount_excluding_tax,
+            "sales_tax": product.sales_tax,
+            "amount_in_tax": product.amount_including_tax,
+        } for product in invoice.products],
+    }
+
+
+def iter_invoices(ids=None, supplier=None, customer=None, start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Loads the invoices to export in id order, one batch per query.
+    Args:
+        ids (list): Restrict to these invoice ids.
+        supplier (str): Restrict to one supplier name.
+        customer (str): Restrict to one customer name.
+        start (date): Earliest invoice date.
+        end (date): Latest invoice date.
+        batch_size (int): Invoices per query.
+    Yields:
+        tuple: The invoice id and its render_invoice fields.
+    """
+    query = select(Invoice).options(selectinload(Invoice.products)).order_by(Invoice.id)
+    if ids:
+        query = query.where(Invoice.id.in_(ids))
+    if supplier:
+        query = query.where(Invoice.name == supplier)
+    if customer:
+        query = query.where(Invoice.customer_name == customer)
+    if start:
+        query = query.where(Invoice.invoice_date >= start)
+    if end:
+        query = query.where(Invoice.invoice_date <= end)
+
+    last_id = 0
+    while True:
+        invoices = db.session.execute(query.where(Invoice.id > last_id).limit(batch_size)).scalars().all()
+        if not invoices:
+            return
+        for invoice in invoices:
+            yield invoice.id, invoice_fields(invoice)
+        last_id = invoices[-1].id
+        db.session.expunge_all()
+
+
+def _render(invoice_id, fields):
+    return f"invoice_{invoice_id}.pdf", render_invoice(fields)
+
+
+def render_parallel(invoices, pool=None, max_pending=None):
+    """
+    Renders invoices across the process pool.
+    At most `max_pending` invoices are in flight, so memory stays bounded
+    however many invoices are exported.
+    Args:
+        invoices: Iterable of (invoice_id, fields).
+        pool (ProcessPoolExecutor): Defaults to the shared export pool.
+        max_pending (int): Invoices submitted but not yet consumed.
+    Yields:
+        tuple: File name and PDF bytes, in completion order.
+    """
+    pool = pool or get_export_pool()
+    max_pending = max_pending or 2 * EXPORT_WORKERS
+    pending = set()
+    try:
+        for invoice_id, fields in invoices:
+            pending.add(pool.submit(_render, invoice_id, fields))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # A client that disconnects should not keep the pool busy
+        for future in pending:
+            future.cancel()
+
+
+class _ZipStream:
+    """Write-only buffer handed to ZipFile, drained after every member."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files):
+    """
+    Packs (name, bytes) pairs into a ZIP written on the fly, without temp files.
+    Yields:
+        bytes: Consecutive parts of the archive.
+    """
+    buffer = _ZipStream()
+    # PDFs are compressed already, storing them keeps the archive cheap to build
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def main():
+    """Exports stored invoices to a ZIP of PDFs, e.g. `python -m utils.invoice_export -o audit.zip`."""
+    from flask import Flask
+    from utils.storage import database_config, configure_engines
+
+    parser = argparse.ArgumentParser(description="Export stored invoices as a ZIP of PDFs")
+    parser.add_argument("-o", "--output", required=True, help="ZIP file to write, - for stdout")
+    parser.add_argument("--ids", help="Comma separated invoice ids")
+    parser.add_argument("--supplier", help="Only invoices of this supplier")
+    parser.add_argument("--customer", help="Only invoices of this customer")
+    parser.add_argument("--start", type=date.fromisoformat, help="Earliest invoice date, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, help="Latest invoice date, YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="Rendering processes")
+    args = parser.parse_args()
+
+    app = Flask(__name__, instance_path=os.path.abspath("instance"))
+    app.config.update(database_config())
+    db.init_app(app)
+
+    ids = [int(i) for i in args.ids.split(",")] if args.ids else None
+    started = time.perf_counter()
+    count = 0
+
+    def progress(files):
+        nonlocal count
+        for name, data in files:
+            count += 1
+            if count % 100 == 0:
+                elapsed = time.perf_counter() - started
+                print(f"Rendered {count} invoices ({count / elapsed:.1f}/s)", file=sys.stderr)
+            yield name, data
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    with app.app_context(), export_pool(args.workers) as pool, out:
+        configure_engines(db)
+        invoices = iter_invoices(ids, args.supplier, args.customer, args.start, args.end)
+        for part in stream_zip(progress(render_parallel(invoices, pool, 2 * args.workers))):
+            out.write(part)
+
+    elapsed = time.perf_counter() - started
+    print(f"Exported {count} invoices in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import threading
+from io import BytesIO
+from xml.sax.saxutils import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "logo.png")
+
+# Styles are built once and never modified afterwards, so concurrent renders share them safely
+_SAMPLE_STYLES = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle("InvoiceTitle", parent=_SAMPLE_STYLES["Title"])
+NORMAL_STYLE = ParagraphStyle("InvoiceNormal", parent=_SAMPLE_STYLES["Normal"])
+DETAIL_STYLE = ParagraphStyle("InvoiceDetail", parent=_SAMPLE_STYLES["BodyText"], fontSize=9)
+HEADER_CELL_STYLE = ParagraphStyle("InvoiceHeaderCell")
+
+HEADER_TABLE_STYLE = TableStyle([
+    ("VALIGN", (0, 0), (0, 0), "TOP"),  # Keep the logo slot where the page frame draws the logo
+    ("ALIGN", (1, 0), (1, 0), "CENTER")  # Align business name to the center
+])
+HEADER_COL_WIDTHS = [60, 480]
+SERIAL_DATE_TABLE_STYLE = TableStyle([("ALIGN", (1, 0), (1, 0), "RIGHT")])
+PRODUCT_TABLE_STYLE = TableStyle([
+    ("GRID", (0, 0), (-1, -1), 1, colors.black),
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+    ("ALIGN", (0, 0), (-1, -1), "LEFT")
+])
+FOOTER_TABLE_STYLE = TableStyle([
+    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ("FONTNAME", (0, 0), (-1, -1), "Helvetica")
+])
+
+PRODUCT_HEADER = ["SR. NO.", "Description", "Quantity", "Rate", "Amount Excluding ST", "Sales Tax", "Amount Including ST"]
+PRODUCT_COL_WIDTHS = [50, 180, 50, 60, 80, 80, 80]
+PRODUCT_ROWS = 12
+BLANK_ROW = [""] * len(PRODUCT_HEADER)
+
+SUPPLIER_LABELS = [
+    ("Supplier's Name:", "supplier_name"),
+    ("Address:", "supplier_address"),
+    ("S.T. Reg. No.:", "supplier_st_no"),
+    ("NTN:", "supplier_ntn"),
+]
+BUYER_LABELS = [
+    ("Buyer's Name:", "buyer_name"),
+    ("Address:", "buyer_address"),
+    ("S.T. Reg. No.:", "buyer_st_no"),
+    ("NTN:", "buyer_ntn"),
+    ("Contact No.:", "buyer_contact"),
+]
+
+LOGO_SIZE = 50
+FRAME_FORM = "InvoiceFrame"
+
+_logo_lock = threading.Lock()
+_logo = None
+
+
+def _logo_image():
+    """The logo decoded once per process, every document draws from the same reader."""
+    global _logo
+    with _logo_lock:
+        if _logo is None:
+            image = ImageReader(LOGO_PATH)
+            image.getRGBData()  # Decode now, not inside the first render
+            _logo = image
+        return _logo
+
+
+def _draw_frame(canv, doc):
+    """
+    Page callback drawing the fixed frame of the first page, the logo, in
+    the slot the header table leaves for it. The frame is recorded once per
+    document as a form and placed with doForm, not laid out as a flowable.
+    """
+    if not canv.hasForm(FRAME_FORM):
+        # Same position as the left header cell: the table is centred in the
+        # frame, the cell pads by 6pt and the frame by 6pt at the top
+        x = doc.leftMargin + (doc.width - sum(HEADER_COL_WIDTHS)) / 2 + 6
+        y = doc.pagesize[1] - doc.topMargin - 6 - 3 - LOGO_SIZE
+        canv.beginForm(FRAME_FORM)
+        canv.drawImage(_logo_image(), x, y, LOGO_SIZE, LOGO_SIZE, mask="auto")
+        canv.endForm()
+    canv.doForm(FRAME_FORM)
+
+
+def _text(value):
+    # Field values are plain text, never Paragraph markup
+    return escape("" if value is None else str(value))
+
+
+def _amount(value):
+    return Paragraph(f"{float(value):,.2f}", NORMAL_STYLE) if value not in (None, "") else ""
+
+
+def product_row(number, product):
+    """Table row of one product, amounts formatted with thousands separators."""
+    quantity = product.get("quantity")
+    return [
+        str(number),
+        Paragraph(_text(product.get("description")), NORMAL_STYLE),
+        Paragraph(_text(quantity), NORMAL_STYLE) if quantity not in (None, "") else "",
+        _amount(product.get("rate")),
+        _amount(product.get("amount_ex_tax")),
+        _amount(product.get("sales_tax")),
+        _amount(product.get("amount_in_tax")),
+    ]
+
+
+def render_invoice(invoice):
+    """
+    Renders a sales tax invoice.
+    Args:
+        invoice (dict): Form field names (supplier_name, buyer_ntn, invoice_date, ...)
+            plus `products`, a list of dicts with description, quantity, rate,
+            amount_ex_tax, sales_tax and amount_in_tax.
+    Returns:
+        bytes: The PDF document.
+    """
+    products = [
+        product_row(number, product)
+        for number, product in enumerate(invoice.get("products", [])[:PRODUCT_ROWS], start=1)
+    ]
+    # Add blank rows to make the table 12 rows long
+    products += [BLANK_ROW] * (PRODUCT_ROWS - len(products))
+
+    content = []
+
+    # Header, the logo is drawn by the page frame
+    header_table = Table(
+        [[Spacer(LOGO_SIZE, LOGO_SIZE), Paragraph(f"<b>{_text(invoice.get('business_name'))}</b>", TITLE_STYLE)]],
+        colWidths=HEADER_COL_WIDTHS
+    )
+    header_table.setStyle(HEADER_TABLE_STYLE)
+    content.append(header_table)
+    content.append(Spacer(1, 12))
+
+    # Title
+    content.append(Paragraph("SALES TAX INVOICE", NORMAL_STYLE))
+    content.append(Spacer(1, 12))
+
+    # Serial and Date
+    serial_date_table = Table(
+        [[Paragraph(f"<b>Serial No.:</b> {_text(invoice.get('serial_number'))}", NORMAL_STYLE),
+          Paragraph(f"<b>Date:</b> {_text(invoice.get('invoice_date'))}", NORMAL_STYLE)]],
+        colWidths=[300, 100]
+    )
+    serial_date_table.setStyle(SERIAL_DATE_TABLE_STYLE)
+    content.append(serial_date_table)
+    content.append(Spacer(1, 12))
+
+    # Supplier and Buyer Details
+    for heading, labels in (("Supplier's Details:", SUPPLIER_LABELS), ("Buyer's Details:", BUYER_LABELS)):
+        content.append(Paragraph(f"<b>{heading}</b>", DETAIL_STYLE))
+        for label, field in labels:
+            content.append(Paragraph(f"<b>{label}</b> {_text(invoice.get(field))}", DETAIL_STYLE))
+        content.append(Spacer(1, 12))
+
+    # Product Table
+    product_table = Table(
+        [[Paragraph(label, HEADER_CELL_STYLE) for label in PRODUCT_HEADER]] + products,
+        colWidths=PRODUCT_COL_WIDTHS
+    )
+    product_table.setStyle(PRODUCT_TABLE_STYLE)
+    content.append(product_table)
+    content.append(Spacer(1, 12))
+
+    # Footer
+    footer_table = Table([
+        [Paragraph(f"<b>Sales Tax:</b> {_text(invoice.get('total_sales_tax'))}", NORMAL_STYLE),
+         Paragraph("<b>Signature:</b> ___________________", NORMAL_STYLE)],
+        [Paragraph(f"<b>Net Tax Inclusive Value:</b> {_text(invoice.get('total_in_tax'))}", NORMAL_STYLE),
+         Paragraph("<b>Name and Designation:</b> ___________________", NORMAL_STYLE)]
+    ], colWidths=[285, 285])
+    footer_table.setStyle(FOOTER_TABLE_STYLE)
+    content.append(footer_table)
+
+    # Build PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=20, leftMargin=20, topMargin=30, bottomMargin=30)
+    doc.build(content, onFirstPage=_draw_frame)
+    return buffer.getvalue()
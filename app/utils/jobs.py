@@ -0,0 +1,448 @@
+import os
+import json
+import sqlite3
+import time
+import uuid
+import threading
+import multiprocessing
+try:
+    import fcntl
+except ImportError:  # Windows, no advisory locks
+    fcntl = None
+from contextlib import closing
+from utils.result_cache import ResultCache
+from utils.storage import READONLY_BIND
+from utils import metrics
+from utils.logs import log_context, log_stage
+
+QUEUED = "queued"
+RUNNING = "running"
+STORING = "storing"   # Extracted, waiting for the ingestion writer
+WRITING = "writing"   # Claimed by the ingestion writer
+DONE = "done"
+FAILED = "failed"
+
+# The ingestion writer waits this long for more results before committing a small batch
+INGEST_LINGER = float(os.environ.get("INGEST_LINGER", 0.5))
+INGEST_MAX_JOBS = int(os.environ.get("INGEST_MAX_JOBS", 50))
+
+# Seconds between checks for dead worker and writer processes
+SUPERVISE_INTERVAL = float(os.environ.get("SUPERVISE_INTERVAL", 5))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    content_hash TEXT,
+    results TEXT,
+    status TEXT NOT NULL,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER,
+    message TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+def connect(queue_path):
+    """Opens the queue database, creating its schema on first use."""
+    os.makedirs(os.path.dirname(os.path.abspath(queue_path)), exist_ok=True)
+    conn = sqlite3.connect(queue_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # Queues created by earlier versions lack the newer columns
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column in ("content_hash", "results"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+    return conn
+
+
+def enqueue(queue_path, file_path, content_hash=None):
+    """
+    Adds a document to the queue.
+    Args:
+        queue_path (str): Path to the queue database.
+        file_path (str): Path of the uploaded file to process.
+        content_hash (str): SHA-256 of the file, used to reuse earlier results.
+    Returns:
+        str: The id of the new job.
+    """
+    job_id = uuid.uuid4().hex
+    with closing(connect(queue_path)) as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, file_path, content_hash, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, file_path, content_hash, QUEUED, time.time()),
+        )
+    return job_id
+
+
+def claim(conn, worker):
+    """Atomically marks the oldest queued job as running and returns it, or None."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started_at = ? WHERE id = ?",
+                (RUNNING, worker, time.time(), row["id"]),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return dict(row) if row is not None else None
+
+
+def update_progress(conn, job_id, pages_done, pages_total):
+    conn.execute(
+        "UPDATE jobs SET pages_done = ?, pages_total = ? WHERE id = ?",
+        (pages_done, pages_total, job_id),
+    )
+
+
+def finish(conn, job_id, status, message):
+    conn.execute(
+        "UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE id = ?",
+        (status, message, time.time(), job_id),
+    )
+
+
+def hand_off(conn, job_id, json_paths):
+    """Passes the extracted JSON files of a job to the ingestion writer."""
+    conn.execute(
+        "UPDATE jobs SET status = ?, results = ? WHERE id = ?",
+        (STORING, json.dumps(json_paths), job_id),
+    )
+
+
+def pending_count(conn):
+    """Returns the number of jobs waiting for the ingestion writer."""
+    (count,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (STORING,)).fetchone()
+    return count
+
+
+def claim_results(conn, writer, limit):
+    """
+    Atomically marks the oldest jobs waiting for the writer as being written.
+    Only rows still waiting are taken, so two writers never store the same job.
+    Args:
+        conn (sqlite3.Connection): Queue database connection.
+        writer (str): Name of the claiming writer, stored in `worker`.
+        limit (int): Most jobs to claim.
+    Returns:
+        list: The claimed jobs as dicts.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [row["id"] for row in conn.execute(
+            "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT ?", (STORING, limit)
+        )]
+        rows = []
+        if ids:
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(
+                f"UPDATE jobs SET status = ?, worker = ? WHERE id IN ({placeholders}) AND status = ?",
+                (WRITING, writer, *ids, STORING),
+            )
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({placeholders}) AND status = ? AND worker = ? ORDER BY created_at",
+                (*ids, WRITING, writer),
+            ).fetchall()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return [dict(row) for row in rows]
+
+
+def get_job(queue_path, job_id):
+    """Returns the job as a dict, or None if it does not exist."""
+    with closing(connect(queue_path)) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def queue_depth(queue_path):
+    """Returns the number of jobs that are queued, running or waiting to be stored."""
+    with closing(connect(queue_path)) as conn:
+        (depth,) = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?, ?, ?)", (QUEUED, RUNNING, STORING, WRITING)
+        ).fetchone()
+    return depth
+
+
+def _is_alive(worker):
+    try:
+        os.kill(int(worker.rsplit("-", 1)[-1]), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def requeue_stale(queue_path):
+    """Puts jobs whose worker or writer process has died back in the queue."""
+    with closing(connect(queue_path)) as conn:
+        rows = conn.execute(
+            "SELECT id, status, worker FROM jobs WHERE status IN (?, ?)", (RUNNING, WRITING)
+        ).fetchall()
+        for row in rows:
+            if row["worker"] and _is_alive(row["worker"]):
+                continue
+            if row["status"] == RUNNING:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, started_at = NULL WHERE id = ? AND status = ?",
+                    (QUEUED, row["id"], RUNNING),
+                )
+            else:
+                # store_results skips files a dead writer already committed
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL WHERE id = ? AND status = ?",
+                    (STORING, row["id"], WRITING),
+                )
+
+
+def _create_worker_app(config):
+    """Builds a minimal Flask app so workers can use the database and loggers."""
+    from flask import Flask
+    from utils.models import db
+    from utils.logs import logging_setup
+    from utils.storage import database_config, configure_engines
+
+    app = Flask(__name__, instance_path=config["instance_path"])
+    app.config.update(database_config(config["database_uri"], config["database_read_uri"]))
+    db.init_app(app)
+    with app.app_context():
+        configure_engines(db)
+    app.info_logger, app.error_logger = logging_setup()
+    app.result_cache = ResultCache(config["result_cache_path"], config["result_cache_max_bytes"])
+    return app
+
+
+def process_job(job, conn, cache=None):
+    """Runs the extraction pipeline for one job and returns the JSON files it produced."""
+    from utils.pipelline import process_file, write_pages, DEFAULT_MODEL_PATH, extraction_settings
+    from utils.model_registry import registry
+
+    def progress(pages_done, pages_total):
+        update_progress(conn, job["id"], pages_done, pages_total)
+
+    content_hash = job.get("content_hash")
+    if cache is None or not content_hash:
+        return process_file(job["file_path"], "json", progress=progress)
+
+    # Identical bytes run through the same model, cleaner and settings give identical results
+    key = (content_hash, registry.version(DEFAULT_MODEL_PATH), extraction_settings())
+    pages = cache.get(*key)
+    if pages is not None:
+        json_paths = write_pages(pages, job["file_path"], "json")
+        os.remove(job["file_path"])
+        progress(len(pages), len(pages))
+    else:
+        json_paths = process_file(job["file_path"], "json", progress=progress)
+        pages = []
+        for json_path in json_paths:
+            with open(json_path) as f:
+                pages.append(json.load(f))
+        cache.put(*key, pages)
+    return json_paths
+
+
+def worker_loop(config, poll_interval=1.0):
+    """Drains the queue forever, one job at a time, and hands the results to the writer."""
+    app = _create_worker_app(config)
+    worker = f"worker-{os.getpid()}"
+    conn = connect(config["queue_path"])
+
+    with app.app_context():
+        while True:
+            metrics.flush(config["metrics_path"])
+            job = claim(conn, worker)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            # Everything logged while the job runs carries its id and document
+            with log_context(job_id=job["id"], document=os.path.basename(job["file_path"])):
+                app.info_logger.info(f"Job {job['id']} started: {job['file_path']}")
+                started = time.perf_counter()
+                try:
+                    json_paths = process_job(job, conn, app.result_cache)
+                    hand_off(conn, job["id"], json_paths)
+                    app.info_logger.info(
+                        f"Job {job['id']} extracted {len(json_paths)} page(s)",
+                        extra={"stage": "extract", "pages": len(json_paths),
+                               "duration_ms": round((time.perf_counter() - started) * 1000, 3)},
+                    )
+                except Exception as e:
+                    finish(conn, job["id"], FAILED, str(e))
+                    app.error_logger.error(f"Job {job['id']} failed: {e}")
+
+
+def store_results(jobs):
+    """
+    Stores the results of several jobs in as few transactions as possible.
+    Args:
+        jobs (list): Jobs returned by `claim_results`.
+    Returns:
+        list: (job_id, status, message) for every job.
+    """
+    from utils.process_json import store_json_files
+
+    paths = {job["id"]: json.loads(job["results"] or "[]") for job in jobs}
+    # A writer restarted mid-batch finds the committed files already gone
+    files = [path for job_paths in paths.values() for path in job_paths if os.path.exists(path)]
+    _, failed = store_json_files(files) if files else ([], [])
+    errors = dict(failed)
+
+    outcomes = []
+    for job in jobs:
+        job_errors = [str(errors[path]) for path in paths[job["id"]] if path in errors]
+        if job_errors:
+            message = f"Error processing JSON: {len(job_errors)} page(s) failed, first: {job_errors[0]}"
+            outcomes.append((job["id"], FAILED, message))
+        else:
+            outcomes.append((job["id"], DONE, f"Stored {len(paths[job['id']])} page(s)."))
+    return outcomes
+
+
+def writer_loop(config, poll_interval=0.5):
+    """
+    The single ingestion writer: the only process writing invoices.
+    Results of jobs finishing close together are committed together.
+    """
+    app = _create_worker_app(config)
+    writer = f"writer-{os.getpid()}"
+    conn = connect(config["queue_path"])
+
+    with app.app_context():
+        while True:
+            metrics.flush(config["metrics_path"])
+            waiting = pending_count(conn)
+            if not waiting:
+                time.sleep(poll_interval)
+                continue
+            if waiting < INGEST_MAX_JOBS and INGEST_LINGER:
+                time.sleep(INGEST_LINGER)
+            jobs = claim_results(conn, writer, INGEST_MAX_JOBS)
+            if not jobs:
+                continue
+
+            try:
+                with log_stage(app.info_logger, "store", f"Stored results of {len(jobs)} job(s)",
+                               job_ids=[job["id"] for job in jobs]):
+                    outcomes = store_results(jobs)
+            except Exception as e:
+                app.error_logger.error(f"Storing {len(jobs)} job(s) failed: {e}",
+                                       extra={"job_ids": [job["id"] for job in jobs]})
+                outcomes = [(job["id"], FAILED, str(e)) for job in jobs]
+            for job_id, status, message in outcomes:
+                finish(conn, job_id, status, message)
+                app.info_logger.info(f"Job {job_id} {status}: {message}", extra={"job_id": job_id})
+
+
+_workers_lock = None
+
+
+def _acquire_workers_lock(path):
+    """
+    Takes an exclusive lock held for the life of this process.
+    Returns False when another process (a reloader parent, another gunicorn
+    worker) already runs the workers.
+    """
+    global _workers_lock
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lock = open(path, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    lock.write(str(os.getpid()))
+    lock.flush()
+    _workers_lock = lock
+    return True
+
+
+def start_workers(app):
+    """
+    Starts the configured number of background worker processes and the ingestion writer.
+    Args:
+        app (Flask): The application whose configuration the workers share.
+    Returns:
+        list: The started processes.
+    """
+    # Spawned children re-import the app module, only the top process starts workers
+    if multiprocessing.parent_process() is not None:
+        return []
+    # The app module is imported by more than one process under the reloader or gunicorn,
+    # whichever gets the lock first starts the single writer and the workers
+    if not _acquire_workers_lock(app.config["JOB_QUEUE_PATH"] + ".lock"):
+        return []
+
+    config = {
+        "instance_path": app.instance_path,
+        "database_uri": app.config["SQLALCHEMY_DATABASE_URI"],
+        "database_read_uri": app.config["SQLALCHEMY_BINDS"].get(READONLY_BIND),
+        "queue_path": app.config["JOB_QUEUE_PATH"],
+        "result_cache_path": app.config["RESULT_CACHE_PATH"],
+        "result_cache_max_bytes": app.config["RESULT_CACHE_MAX_BYTES"],
+        "metrics_path": app.config["METRICS_PATH"],
+    }
+    requeue_stale(config["queue_path"])
+    metrics.clear_snapshots(config["metrics_path"])
+
+    targets = [worker_loop] * app.config["JOB_WORKERS"] + [writer_loop]
+    workers = [_start(target, config) for target in targets]
+
+    supervisor = threading.Thread(
+        target=supervise, args=(workers, targets, config, app.error_logger), daemon=True
+    )
+    supervisor.start()
+    return workers
+
+
+def _start(target, config):
+    process = multiprocessing.Process(target=target, args=(config,), daemon=True)
+    process.start()
+    return process
+
+
+def supervise(workers, targets, config, logger, interval=SUPERVISE_INTERVAL):
+    """
+    Restarts worker and writer processes that died, e.g. killed for running
+    out of memory on a large PDF, and puts the jobs they held back in the queue.
+    Args:
+        workers (list): Processes started by `start_workers`, replaced in place.
+        targets (list): The loop each process runs, in the same order.
+        config (dict): Worker configuration.
+        logger (logging.Logger): Logger for restarts.
+        interval (float): Seconds between checks.
+    """
+    while True:
+        time.sleep(interval)
+        # is_alive() reaps exited children, so their pids no longer look alive to requeue_stale
+        dead = [i for i, process in enumerate(workers) if not process.is_alive()]
+        if not dead:
+            continue
+        try:
+            requeue_stale(config["queue_path"])
+        except Exception as e:
+            logger.error(f"Requeueing jobs of dead workers failed: {e}")
+        for i in dead:
+            process = workers[i]
+            logger.error(f"{targets[i].__name__} process {process.pid} exited with code "
+                         f"{process.exitcode}, restarting")
+            workers[i] = _start(targets[i], config)
@@ -1,34 +1,185 @@
-import logging
 import os
-from logging.handlers import RotatingFileHandler
-
-def logging_setup():
-    """Configure logging for the application"""
-    # Define the log directory and files
-    LOG_DIR = "logs"
-    INFO_LOG = os.path.join(LOG_DIR, "info.log")
-    ERROR_LOG = os.path.join(LOG_DIR, "error.log")
-    
-    # Create the log directory if it doesn't exist
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-    
-    # Configure the logging for info logs
+import copy
+import json
+import time
+import atexit
+import random
+import logging
+import multiprocessing
+import multiprocessing.util
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+LOG_DIR = "logs"
+
+# Share of high-volume info events (logged with extra={"sampled": True}) that are kept
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+
+# Correlation fields (job_id, document, ...) added to every record logged in the current context
+_context = ContextVar("log_context", default={})
+
+# Attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sampled"}
+
+_listener = None
+_log_queue = None
+_handlers = []
+_setup_pid = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Adds `fields` to every record logged inside the block, nested blocks extend the outer one."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextmanager
+def log_stage(logger, stage, message=None, **fields):
+    """Logs how long the block took, as `duration_ms` of `stage`."""
+    started = time.perf_counter()
+    yield
+    duration_ms = round((time.perf_counter() - started) * 1000, 3)
+    logger.info(message or f"{stage} done", extra={"stage": stage, "duration_ms": duration_ms, **fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, context and extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES
+        )
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Hands records to the background listener.
+    Runs on the logging thread, so it captures the correlation context and
+    drops sampled records there; formatting and file I/O happen on the listener.
+    """
+
+    def __init__(self, log_queue, sample_rate=LOG_SAMPLE_RATE):
+        super().__init__(log_queue)
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and record.levelno <= logging.INFO:
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        record.msg, record.args = record.getMessage(), None
+        # Records cross process boundaries, keep extra fields picklable
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not isinstance(value, (str, int, float, bool, list, dict, type(None))):
+                setattr(record, key, str(value))
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _flush():
+    """Stops this process' listener once, writing out what is still queued."""
+    global _listener
+    if _listener is not None and _setup_pid == os.getpid():
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+atexit.register(_flush)
+
+
+def log_queue():
+    """The queue feeding this process' listener, pass it to `logging_setup` of spawned children."""
+    return _log_queue
+
+
+def _file_handler(path, logger_name):
+    # Opened on the first record, a process that never logs leaves no file behind
+    handler = RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=5, delay=True)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(logging.Filter(logger_name))  # Each logger keeps its own file
+    return handler
+
+
+def logging_setup(log_queue=None):
+    """
+    Configure logging for the application.
+    Records are queued by the calling thread and written by a background
+    listener, so logging never waits on file I/O or rotation. Calling it
+    again in the same process returns the existing loggers.
+
+    Only one listener writes logs/info.log and logs/error.log: processes
+    forked after setup inherit its queue, spawned ones are handed it through
+    `log_queue`, which replaces any setup the child did before receiving it.
+    A child process with neither writes files of its own, suffixed with its
+    pid, rather than rotating the shared ones.
+    Args:
+        log_queue (multiprocessing.Queue): Queue of the parent's listener, see `log_queue()`.
+    Returns:
+        tuple: The info and error loggers.
+    """
+    global _listener, _log_queue, _setup_pid
     info_logger = logging.getLogger("info_logger")
-    info_logger.setLevel(logging.INFO)
-    
-    # Create a rotating file handler for info logs
-    info_handler = RotatingFileHandler(INFO_LOG, maxBytes=1024 * 1024, backupCount=5)
-    info_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    info_logger.addHandler(info_handler)
-    
-    # Configure the logging for error logs
     error_logger = logging.getLogger("error_logger")
+    if _setup_pid == os.getpid() and (log_queue is None or log_queue is _log_queue):
+        return info_logger, error_logger
+
+    if log_queue is None and _log_queue is not None:
+        # Forked from a configured process, the inherited handlers already feed its listener
+        _listener = None
+        _setup_pid = os.getpid()
+        return info_logger, error_logger
+
+    for logger in (info_logger, error_logger):
+        for handler in _handlers:
+            logger.removeHandler(handler)
+    _handlers.clear()
+
+    _flush()
+    _listener = None
+    if log_queue is None:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        suffix = f"-{os.getpid()}" if multiprocessing.parent_process() is not None else ""
+        # A spawn context queue can be handed to spawned children too, forked ones inherit it either way
+        log_queue = multiprocessing.get_context("spawn").Queue()
+        _listener = QueueListener(
+            log_queue,
+            _file_handler(os.path.join(LOG_DIR, f"info{suffix}.log"), "info_logger"),
+            _file_handler(os.path.join(LOG_DIR, f"error{suffix}.log"), "error_logger"),
+        )
+        _listener.start()
+        # Worker processes skip atexit, multiprocessing runs its finalizers instead
+        multiprocessing.util.Finalize(None, _flush, exitpriority=10)
+    _log_queue = log_queue
+
+    info_logger.setLevel(logging.INFO)
     error_logger.setLevel(logging.ERROR)
-    
-    # Create a rotating file handler for error logs
-    error_handler = RotatingFileHandler(ERROR_LOG, maxBytes=1024 * 1024, backupCount=5)
-    error_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    error_logger.addHandler(error_handler)
-    
-    return info_logger, error_logger
\ No newline at end of file
+    for logger in (info_logger, error_logger):
+        handler = ContextQueueHandler(log_queue)
+        logger.addHandler(handler)
+        _handlers.append(handler)
+
+    _setup_pid = os.getpid()
+    return info_logger, error_logger
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds between snapshots written by worker processes
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+# Upper bounds of the histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    "cvip_stage_seconds": ("Latency of each pipeline stage, inference and OCR per detection batch.", LATENCY_BUCKETS),
+    "cvip_ocr_seconds": ("Latency of tesseract calls per field label.", LATENCY_BUCKETS),
+    "cvip_boxes_per_page": ("Detected fields per page.", COUNT_BUCKETS),
+}
+COUNTERS = {
+    "cvip_pages_total": "Pages run through the pipeline, rate() gives pages per second.",
+    "cvip_boxes_total": "Fields detected per label.",
+    "cvip_stage_errors_total": "Pipeline stages that raised, ocr_crop and ocr_mosaic count single tesseract calls within ocr.",
+    "cvip_db_rows_total": "Invoice and product rows inserted.",
+    "cvip_db_failed_documents_total": "JSON documents that could not be stored.",
+    "cvip_ocr_cache_lookups_total": "Header field OCR cache lookups by result, hit or miss.",
+}
+
+
+class Registry:
+    """
+    Counters and fixed-bucket histograms of one process.
+
+    Recording is a dict lookup and a few additions under a lock, cheap enough
+    for the per-box OCR path. Label values become part of the series key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Calls `listener(name, value, labels)` on every observation, e.g. to keep raw samples."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        bounds = HISTOGRAMS[name][1]
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * (len(bounds) + 1), 0.0]
+            series[0][bisect_left(bounds, value)] += 1
+            series[1] += value
+        for listener in self._listeners:
+            listener(name, value, labels)
+
+    @contextmanager
+    def timed(self, stage, name="cvip_stage_seconds", **labels):
+        """Observes the duration of the block, failures are counted as errors of the stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("cvip_stage_errors_total", stage=stage)
+            raise
+        finally:
+            if name == "cvip_stage_seconds":
+                labels["stage"] = stage
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """The recorded series as plain JSON-serialisable lists."""
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    [name, dict(labels), list(counts), total]
+                    for (name, labels), (counts, total) in self._histograms.items()
+                ],
+            }
+
+
+registry = Registry()
+timed = registry.timed
+inc = registry.inc
+observe = registry.observe
+
+_last_flush = 0.0
+
+
+def flush(metrics_path, force=False):
+    """
+    Writes this process' snapshot to `<metrics_path>/<pid>.json` for the web
+    process to merge. Calls within METRICS_FLUSH_INTERVAL of the last write are skipped.
+    """
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    os.makedirs(metrics_path, exist_ok=True)
+    path = os.path.join(metrics_path, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(f"{path}.tmp", path)  # Readers never see a half written file
+
+
+def clear_snapshots(metrics_path):
+    """Removes the snapshots of a previous run, so restarted workers start from zero."""
+    if not os.path.isdir(metrics_path):
+        return
+    for name in os.listdir(metrics_path):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            os.remove(os.path.join(metrics_path, name))
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("counters", []):
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total in snapshot.get("histograms", []):
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+    return counters, histograms
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(metrics_path=None, gauges=None):
+    """
+    Renders this process' series merged with the worker snapshots in the
+    Prometheus text exposition format.
+    Args:
+        metrics_path (str): Folder holding the worker snapshots.
+        gauges (dict): Extra gauges computed at scrape time, name -> (help, value).
+    Returns:
+        str: The exposition text.
+    """
+    snapshots = [registry.snapshot()]
+    if metrics_path and os.path.isdir(metrics_path):
+        own = f"{os.getpid()}.json"
+        for name in sorted(os.listdir(metrics_path)):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(metrics_path, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Removed or replaced while listing
+    counters, histograms = _merge(snapshots)
+
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    for name, (help_text, bounds) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (series, labels), (counts, total) in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(bounds) + ["+Inf"], counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(float(total))}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+from sqlalchemy import inspect, text, select, update, bindparam
+from utils.models import db, Invoice
+from utils.dates import parse_invoice_date
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_invoice_dates(conn):
+    """Parses the raw date text of existing invoices into `invoice_date`."""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Invoice.id, Invoice.date)
+            .where(Invoice.id > last_id)
+            .order_by(Invoice.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        parsed = [
+            {"row_id": row.id, "parsed": parse_invoice_date(row.date)}
+            for row in rows
+        ]
+        parsed = [row for row in parsed if row["parsed"] is not None]
+        if parsed:
+            conn.execute(
+                update(Invoice.__table__)
+                .where(Invoice.id == bindparam("row_id"))
+                .values(invoice_date=bindparam("parsed")),
+                parsed,
+            )
+
+
+# Columns added after their table was first created:
+# (table, column, DDL type and default, backfill run once when the column is added)
+ADDED_COLUMNS = [
+    ("summary_counters", "version", "INTEGER NOT NULL DEFAULT 0", None),
+    ("invoices", "invoice_date", "DATE", backfill_invoice_dates),
+]
+
+
+def upgrade():
+    """
+    Brings an existing database up to the current models.
+    db.create_all only creates missing tables, so columns and indexes added
+    to existing tables are applied here. Every step is idempotent.
+    """
+    with db.engine.begin() as conn:
+        # Inspect through the transaction's connection, a second one would wait on its write lock
+        inspector = inspect(conn)
+        for table, column, ddl, backfill in ADDED_COLUMNS:
+            columns = {c["name"] for c in inspector.get_columns(table)}
+            if column not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                if backfill:
+                    backfill(conn)
+
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
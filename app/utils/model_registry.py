@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+
+class _Entry:
+    """A resident detector together with the metadata needed to share it."""
+
+    def __init__(self, model, version, exclusive):
+        self.model = model
+        self.version = version
+        self.exclusive = exclusive
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded detectors.
+
+    Each model file is loaded at most once per process and kept resident.
+    ultralytics models keep predictor state on the instance and are not safe
+    to call concurrently, so they are borrowed under a per-model lock;
+    onnxruntime sessions can be shared freely between threads.
+    """
+
+    def __init__(self, loader=None):
+        self._loader = loader
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, model_path):
+        if self._loader is None:
+            # Imported lazily, utils.pipelline imports this module
+            from utils.pipelline import load_model
+            self._loader = load_model
+        return self._loader(model_path)
+
+    def _entry(self, model_path):
+        key = os.path.abspath(model_path)
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                model = self._load(model_path)
+                exclusive = not model_path.endswith(".onnx")
+                entry = _Entry(model, model_version(model_path), exclusive)
+                self._entries[key] = entry
+        return entry
+
+    def get(self, model_path):
+        """Returns the resident model for `model_path`, loading it on first use."""
+        return self._entry(model_path).model
+
+    def version(self, model_path):
+        """Returns the version string of the model loaded from `model_path`."""
+        return self._entry(model_path).version
+
+    @contextmanager
+    def borrow(self, model_path):
+        """Yields the resident model, holding its lock if it cannot be shared."""
+        entry = self._entry(model_path)
+        if not entry.exclusive:
+            yield entry.model
+            return
+        with entry.lock:
+            yield entry.model
+
+    def loaded(self):
+        """Returns a mapping of loaded model paths to their versions."""
+        return {path: entry.version for path, entry in self._entries.items()}
+
+    def evict(self, model_path):
+        """Drops a model so that the next use reloads it from disk."""
+        with self._lock:
+            self._entries.pop(os.path.abspath(model_path), None)
+
+
+def model_version(model_path, chunk_size=1024 * 1024):
+    """
+    Identifies a weights file by the digest of its contents.
+    Args:
+        model_path (str): Path to the model file.
+    Returns:
+        str: The first 12 hex digits of the file's SHA-256.
+    """
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+registry = ModelRegistry()
@@ -1,14 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from utils.storage import RoutingSession
 
-db = SQLAlchemy()
+# Request handlers read through the read-only bind, see utils/storage.py
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Define the Invoice model
 class Invoice(db.Model):
     __tablename__ = "invoices"
+    __table_args__ = (
+        db.Index("ix_invoices_name_invoice_date", "name", "invoice_date"),
+        db.Index("ix_invoices_customer_name_invoice_date", "customer_name", "invoice_date"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     ntn = db.Column(db.String(50), nullable=False)
-    name = db.Column(db.String(200), nullable=True)
+    name = db.Column(db.String(200), nullable=True, index=True)
     st_reg_no = db.Column(db.String(50), nullable=False)
     address = db.Column(db.String(200), nullable=False)
     customer_receipt_no = db.Column(db.Integer, nullable=False)
@@ -18,7 +24,8 @@ class Invoice(db.Model):
     customer_phone_number = db.Column(db.String(20), nullable=False)
     customer_address = db.Column(db.String(200), nullable=False)
     business_name = db.Column(db.String(200), nullable=False)
-    date = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.String(20), nullable=False)  # Raw text as read by OCR
+    invoice_date = db.Column(db.Date, nullable=True, index=True)  # Normalized from `date`
     total_amount_excluding_tax = db.Column(db.Float, nullable=False)
     total_sales_tax = db.Column(db.Float, nullable=False)
     total_amount_including_tax = db.Column(db.Float, nullable=False)
@@ -33,8 +40,8 @@ class Invoice(db.Model):
 class Product(db.Model):
     __tablename__ = "products"
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey("invoices.id"), nullable=False)
-    product_name = db.Column(db.String(200), nullable=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey("invoices.id"), nullable=False, index=True)
+    product_name = db.Column(db.String(200), nullable=True, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     rate = db.Column(db.Integer, nullable=False)
     tax = db.Column(db.Float, nullable=False)
@@ -44,4 +51,25 @@ class Product(db.Model):
     amount_including_tax = db.Column(db.Float, nullable=False)
 
     def __repr__(self):
-        return f'<Product {self.id} for Invoice {self.invoice_id}>'
\ No newline at end of file
+        return f'<Product {self.id} for Invoice {self.invoice_id}>'
+
+# Reference counts of the distinct sellers, customers and products in the invoices
+class SummaryCounter(db.Model):
+    __tablename__ = "summary_counters"
+    kind = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    # Ingest generation of the last change to this key, lets readers cache per key
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SummaryCounter {self.kind}:{self.key}={self.count}>'
+
+# Dashboard highlights maintained at ingestion time
+class DashboardSummary(db.Model):
+    __tablename__ = "dashboard_summary"
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<DashboardSummary {self.name}={self.value}>'
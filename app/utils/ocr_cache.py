@@ -0,0 +1,166 @@
+import os
+import json
+import atexit
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from utils import metrics
+
+# Header fields that print identically on every invoice of a supplier
+DEFAULT_LABELS = ["supplierName", "supplierAddress", "supplierNTN", "supplierSTN", "businessName"]
+
+
+def trim_to_ink(crop):
+    """The part of a binarized crop between its outermost dark pixels, so boxes shifted by a few pixels match."""
+    ink = crop < 128
+    rows = np.flatnonzero(ink.any(axis=1))
+    if len(rows) == 0:
+        return crop
+    columns = np.flatnonzero(ink.any(axis=0))
+    return crop[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+
+
+def perceptual_hash(crop, height=12, width_step=4, max_width=512):
+    """
+    Difference hash of the inked part of a preprocessed crop.
+    The grid keeps the text's aspect ratio, rounded to `width_step` columns,
+    so every glyph spans a few cells and a one-character change still alters
+    several bits. Near duplicates are matched by `hash_distance`.
+    Args:
+        crop (np.ndarray): Single-channel preprocessed crop.
+        height (int): Rows of the hash grid.
+        width_step (int): Columns are a multiple of this.
+        max_width (int): Upper bound on the columns of the hash grid.
+    Returns:
+        str: Hex digest prefixed with the grid size.
+    """
+    crop = trim_to_ink(crop)
+    columns = height * crop.shape[1] / max(crop.shape[0], 1)
+    width = int(np.clip(round(columns / width_step) * width_step, width_step, max_width))
+    small = cv2.resize(crop, (width + 1, height), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return f"{width}x{height}:{bits.tobytes().hex()}"
+
+
+def _parse_hash(key):
+    size, _, digest = key.partition(":")
+    return size, int(digest or "0", 16)
+
+
+def hash_distance(a, b):
+    """Number of differing bits of two hashes, None when their grids differ."""
+    size_a, bits_a = _parse_hash(a)
+    size_b, bits_b = _parse_hash(b)
+    if size_a != size_b:
+        return None
+    return (bits_a ^ bits_b).bit_count()
+
+
+def max_distance(key):
+    """Bits two hashes of the same text may differ by: well under what changing one glyph flips."""
+    height = int(key.partition(":")[0].partition("x")[2] or 0)
+    return height * height // 8
+
+
+class OcrCache:
+    """
+    Thread-safe LRU of OCR results keyed by (label, perceptual hash).
+
+    A lookup without an exact match takes the closest entry of the same label
+    and grid within `max_distance` bits, so rescans of the same header hit.
+    Lookups are counted in cvip_ocr_cache_lookups_total.
+
+    When `path` is set the cache is loaded from it on start and written back
+    every `save_every` insertions and at interpreter exit.
+    """
+
+    def __init__(self, capacity=2048, path=None, labels=DEFAULT_LABELS, save_every=50, fuzzy=True):
+        self.capacity = capacity
+        self.path = path
+        self.labels = set(labels)
+        self.save_every = save_every
+        self.fuzzy = fuzzy
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._hashes = {}  # (label, grid size) -> {key: hash bits}, for near matches
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def handles(self, label):
+        return self.capacity > 0 and label in self.labels
+
+    def _closest(self, label, key):
+        size, bits = _parse_hash(key)
+        best, best_distance = None, max_distance(key) + 1
+        for other, other_bits in self._hashes.get((label, size), {}).items():
+            distance = (bits ^ other_bits).bit_count()
+            if distance < best_distance:
+                best, best_distance = other, distance
+        return best
+
+    def get(self, label, key):
+        with self._lock:
+            text = self._entries.get((label, key))
+            if text is None and self.fuzzy:
+                closest = self._closest(label, key)
+                if closest is not None:
+                    key, text = closest, self._entries[(label, closest)]
+            if text is None:
+                self.misses += 1
+                metrics.inc("cvip_ocr_cache_lookups_total", result="miss")
+                return None
+            self._entries.move_to_end((label, key))
+            self.hits += 1
+        metrics.inc("cvip_ocr_cache_lookups_total", result="hit")
+        return text
+
+    def _add(self, label, key, text):
+        self._entries[(label, key)] = text
+        self._entries.move_to_end((label, key))
+        size, bits = _parse_hash(key)
+        self._hashes.setdefault((label, size), {})[key] = bits
+        while len(self._entries) > self.capacity:
+            (old_label, old_key), _ = self._entries.popitem(last=False)
+            self._hashes[(old_label, _parse_hash(old_key)[0])].pop(old_key, None)
+
+    def put(self, label, key, text):
+        with self._lock:
+            self._add(label, key, text)
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for label, key, text in entries[-self.capacity:]:
+                self._add(label, key, text)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[label, key, text] for (label, key), text in self._entries.items()]
+            self._unsaved = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "capacity": self.capacity}
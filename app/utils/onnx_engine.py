@@ -0,0 +1,204 @@
+import ast
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+# Classes the invoice detector was trained on, in model index order
+CLASS_NAMES = [
+    "SRNO",
+    "businessName",
+    "buyerAddress",
+    "buyerContact",
+    "buyerNTN",
+    "buyerName",
+    "buyerSTN",
+    "date",
+    "excl",
+    "incl",
+    "products",
+    "quantity",
+    "rate",
+    "sales",
+    "serialNumber",
+    "supplierAddress",
+    "supplierNTN",
+    "supplierName",
+    "supplierSTN",
+    "total",
+]
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def create_session(model_path, intra_op_num_threads=None, graph_optimization_level="all"):
+    """
+    Creates a CPU inference session.
+    Args:
+        model_path (str): Path to the exported .onnx model.
+        intra_op_num_threads (int): Threads used inside an operator, None lets onnxruntime decide.
+        graph_optimization_level (str): One of "disable", "basic", "extended" or "all".
+    Returns:
+        ort.InferenceSession: The loaded session.
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+    if intra_op_num_threads:
+        options.intra_op_num_threads = intra_op_num_threads
+    return ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def class_names(session):
+    """Reads class names from the metadata ultralytics embeds on export."""
+    names = session.get_modelmeta().custom_metadata_map.get("names")
+    if names:
+        names = ast.literal_eval(names)
+        return [names[i] for i in sorted(names)]
+    return CLASS_NAMES
+
+
+def input_shape(session):
+    """Returns the (height, width) the session expects, 640x640 for dynamic axes."""
+    shape = session.get_inputs()[0].shape
+    height, width = shape[2], shape[3]
+    if isinstance(height, int) and isinstance(width, int):
+        return height, width
+    return 640, 640
+
+
+def letterbox(image, new_shape=(640, 640), color=(114, 114, 114)):
+    """
+    Resizes an image to fit `new_shape` keeping its aspect ratio and pads the rest.
+    Returns:
+        tuple: The padded image, the scale ratio and the (left, top) padding.
+    """
+    height, width = image.shape[:2]
+    ratio = min(new_shape[0] / height, new_shape[1] / width)
+    resized_w, resized_h = round(width * ratio), round(height * ratio)
+    if (resized_w, resized_h) != (width, height):
+        image = cv2.resize(image, (resized_w, resized_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_w, pad_h = (new_shape[1] - resized_w) / 2, (new_shape[0] - resized_h) / 2
+    top, bottom = round(pad_h - 0.1), round(pad_h + 0.1)
+    left, right = round(pad_w - 0.1), round(pad_w + 0.1)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
+
+
+def preprocess(image, shape=(640, 640)):
+    """Letterboxes a BGR image into a normalised 1x3xHxW RGB tensor."""
+    padded, ratio, pad = letterbox(image, shape)
+    blob = padded[:, :, ::-1].transpose(2, 0, 1)
+    blob = np.ascontiguousarray(blob, dtype=np.float32)[None] / 255.0
+    return blob, ratio, pad
+
+
+def decode(output, conf_threshold=0.25):
+    """
+    Decodes a YOLOv8/11 head output of shape (4 + classes, anchors).
+    Returns:
+        tuple: xyxy boxes, scores and class ids above the confidence threshold.
+    """
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+    keep = scores > conf_threshold
+
+    xywh = predictions[keep, :4]
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    return boxes, scores[keep], class_ids[keep]
+
+
+def nms(boxes, scores, class_ids, iou_threshold=0.7, max_detections=300):
+    """
+    Class-aware non-maximum suppression.
+    Boxes are shifted by their class id so boxes of different classes never overlap.
+    Returns:
+        np.ndarray: Indices of the kept boxes, highest score first.
+    """
+    offset = boxes + (class_ids[:, None] * (boxes.max() + 1 if len(boxes) else 0))
+    x1, y1, x2, y2 = offset.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size and len(keep) < max_detections:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def scale_boxes(boxes, ratio, pad, original_shape):
+    """Maps boxes from letterboxed input coordinates back onto the original image."""
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, original_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, original_shape[0])
+    return boxes
+
+
+def postprocess(output, ratio, pad, original_shape, conf_threshold=0.25, iou_threshold=0.7):
+    """Decodes, suppresses and rescales the output of one image."""
+    boxes, scores, class_ids = decode(output, conf_threshold)
+    keep = nms(boxes, scores, class_ids, iou_threshold)
+    boxes = scale_boxes(boxes[keep], ratio, pad, original_shape)
+    return boxes, scores[keep], class_ids[keep]
+
+
+def detect_batch(session, images, conf_threshold=0.25, iou_threshold=0.7):
+    """
+    Runs the detector on several BGR images with a single forward pass.
+    Models exported with a fixed batch size that does not match fall back
+    to one pass per image.
+    Args:
+        session (ort.InferenceSession): The loaded model.
+        images (list): The images to run detection on.
+        conf_threshold (float): Minimum class score.
+        iou_threshold (float): IoU above which same-class boxes are suppressed.
+    Returns:
+        list: (boxes, scores, class_ids) per image, boxes in image coordinates.
+    """
+    batch_dim = session.get_inputs()[0].shape[0]
+    if isinstance(batch_dim, int) and batch_dim != len(images):
+        return [
+            result
+            for image in images
+            for result in detect_batch(session, [image], conf_threshold, iou_threshold)
+        ]
+
+    shape = input_shape(session)
+    prepared = [preprocess(image, shape) for image in images]
+    blob = np.concatenate([blob for blob, _, _ in prepared])
+    outputs = session.run(None, {session.get_inputs()[0].name: blob})[0]
+    return [
+        postprocess(output, ratio, pad, image.shape[:2], conf_threshold, iou_threshold)
+        for output, (_, ratio, pad), image in zip(outputs, prepared, images)
+    ]
+
+
+def detect(session, image, conf_threshold=0.25, iou_threshold=0.7):
+    """
+    Runs the detector on a BGR image.
+    Args:
+        session (ort.InferenceSession): The loaded model.
+        image (np.ndarray): The image to run detection on.
+        conf_threshold (float): Minimum class score.
+        iou_threshold (float): IoU above which same-class boxes are suppressed.
+    Returns:
+        tuple: xyxy boxes in image coordinates, scores and class ids.
+    """
+    return detect_batch(session, [image], conf_threshold, iou_threshold)[0]
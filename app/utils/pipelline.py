@@ -1,50 +1,364 @@
 import os
+import sys
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import pytesseract
 import json
 import re
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
 import onnxruntime as ort
-from pdf2image import convert_from_path
-from utils.process_json import json_to_db
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pdf2image import convert_from_path, pdfinfo_from_path
+from utils.model_registry import registry, model_version
+from utils import onnx_engine
+from utils.ocr_cache import OcrCache, perceptual_hash, DEFAULT_LABELS
+from utils import metrics
+
+# torch/ultralytics are only needed for .pt models, ONNX runs on onnxruntime alone
+try:
+    from ultralytics import YOLO
+except ImportError:
+    YOLO = None
+
+
+DEFAULT_MODEL_PATH = os.environ.get("MODEL_PATH", "model/best.pt")
+
+# onnxruntime session options, 0 threads lets onnxruntime pick
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", 0))
+ONNX_GRAPH_OPTIMIZATION = os.environ.get("ONNX_GRAPH_OPTIMIZATION", "all")
+
+# Pages run through the detector together in one forward pass
+DETECT_BATCH_SIZE = int(os.environ.get("DETECT_BATCH_SIZE", 8))
+
+# The detector sees pages with their long side capped here, OCR crops keep full resolution
+DETECT_MAX_SIDE = int(os.environ.get("DETECT_MAX_SIDE", 1280))
+
+# PDF rasterization: OCR resolution, pixel budget per page, pages rendered per poppler call
+PDF_DPI = int(os.environ.get("PDF_DPI", 300))
+PDF_MAX_PAGE_PIXELS = int(os.environ.get("PDF_MAX_PAGE_PIXELS", 12_000_000))
+PDF_PAGE_WINDOW = int(os.environ.get("PDF_PAGE_WINDOW", 2))
+PDF_THREADS = int(os.environ.get("PDF_THREADS", 2))
+
+# Number of concurrent tesseract calls per process, defaults to this process' share of the
+# cores when JOB_WORKERS job processes each run their own pool
+OCR_WORKERS = int(os.environ.get(
+    "OCR_WORKERS", max((os.cpu_count() or 1) // int(os.environ.get("JOB_WORKERS", 2)), 1)
+))
+
+# OpenMP threads of each tesseract call, the pool already runs one call per core
+TESSERACT_OMP_THREADS = os.environ.get("TESSERACT_OMP_THREADS", "1")
+
+# "parallel" OCRs each box on its own, "batched" packs a page's crops into one tesseract call
+OCR_MODE = os.environ.get("OCR_MODE", "parallel")
+
+# Crops whose text lines are shorter than this many pixels are upscaled towards the target height,
+# body text of a 300 DPI scan measures 30-40 px and is handed to tesseract as is
+OCR_MIN_TEXT_HEIGHT = int(os.environ.get("OCR_MIN_TEXT_HEIGHT", 24))
+OCR_TARGET_TEXT_HEIGHT = int(os.environ.get("OCR_TARGET_TEXT_HEIGHT", 36))
+OCR_MAX_UPSCALE = 3.0
+
+# Blank rows between packed crops, and the tallest canvas handed to tesseract at once
+MOSAIC_MARGIN = 40
+MOSAIC_MAX_HEIGHT = 16000
+
+# Debugging aid: also write each page's uncleaned OCR text as <page>__raw.json next to its output
+OCR_DUMP_RAW = os.environ.get("OCR_DUMP_RAW", "") not in ("", "0")
+
+# File types process_file handles
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+NUMERIC_LABELS = ["quantity", "rate"]
+TEXT_CONFIG = ""
+NUMERIC_CONFIG = "--psm 6 -c tessedit_char_whitelist=0123456789."
+
+# Per-field OCR cache for supplier header regions, 0 disables it
+OCR_CACHE_SIZE = int(os.environ.get("OCR_CACHE_SIZE", 2048))
+OCR_CACHE_PATH = os.environ.get("OCR_CACHE_PATH")  # Persist across restarts when set
+OCR_CACHE_LABELS = os.environ.get("OCR_CACHE_LABELS", ",".join(DEFAULT_LABELS)).split(",")
+
+field_cache = OcrCache(OCR_CACHE_SIZE, OCR_CACHE_PATH, OCR_CACHE_LABELS)
+
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+# The application loggers, configured by utils.logs.logging_setup
+info_logger = logging.getLogger("info_logger")
+error_logger = logging.getLogger("error_logger")
 
 
 # Specify the path to the Tesseract executable for Windows
 # pytesseract.pytesseract.tesseract_cmd = r"C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
 
 
-# Preprocessing for Tesseract
-def preprocess_image(cropped):
-    gray = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY)
-    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+# Preprocessing for Tesseract, done once per page: grayscale, Otsu threshold and a light close
+def binarize_page(image):
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # The Otsu threshold comes from a subsample, its histogram is all that matters
+    step = max(int((gray.size / 500_000) ** 0.5), 1)
+    sample = np.ascontiguousarray(gray[::step, ::step])
+    threshold, _ = cv2.threshold(sample, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-    cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-    resized = cv2.resize(cleaned, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    return resized
+    return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+
+# Typical height of the text lines in a binarized crop
+def text_height(binary):
+    """
+    Measures the runs of rows holding ink, table rules are left out so they
+    neither join lines together nor count as lines of their own.
+    Args:
+        binary (np.ndarray): Binarized crop, dark text on white.
+    Returns:
+        float: Median line height in pixels, 0 when the crop holds no text.
+    """
+    height, width = binary.shape
+    # Pixels are 0 or 255, so the sums count the ink of every row and column
+    rows = width - cv2.reduce(binary, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+    columns = height - cv2.reduce(binary, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+    rules = columns >= 0.5 * height
+    if rules.any():
+        rows -= np.count_nonzero(binary[:, rules] < 128, axis=1)
+        width -= np.count_nonzero(rules)
+    inked = (rows > max(1, width // 500)) & (rows < 0.5 * width)
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], inked, [False])).astype(np.int8)))
+    runs = edges[1::2] - edges[::2]
+    runs = runs[runs >= 3]  # Specks and leftovers of rules
+    return float(np.median(runs)) if len(runs) else 0.0
+
+
+# A box of a binarized page ready for tesseract
+def crop_for_ocr(binary, box):
+    """
+    Returns a view into the binarized page, only crops with small text are
+    upscaled (and thereby copied).
+    Args:
+        binary (np.ndarray): Page returned by `binarize_page`.
+        box (list): x1, y1, x2, y2 in page coordinates.
+    Returns:
+        np.ndarray: The crop, empty when the box lies outside the page.
+    """
+    height, width = binary.shape
+    x1, y1, x2, y2 = map(int, box)
+    crop = binary[max(y1, 0):min(y2, height), max(x1, 0):min(x2, width)]
+    if crop.size == 0:
+        return crop
+    line_height = text_height(crop)
+    if 0 < line_height < OCR_MIN_TEXT_HEIGHT:
+        scale = min(OCR_TARGET_TEXT_HEIGHT / line_height, OCR_MAX_UPSCALE)
+        return cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    return crop
+
+
+# Preprocess a single crop when the rest of its page is not at hand
+def preprocess_image(cropped):
+    return crop_for_ocr(binarize_page(cropped), (0, 0, cropped.shape[1], cropped.shape[0]))
+
+
+# Shared pool for OCR, each tesseract call runs in its own subprocess
+def get_ocr_executor():
+    global _ocr_executor
+    if _ocr_executor is None:
+        with _ocr_executor_lock:
+            if _ocr_executor is None:
+                limit_tesseract_threads()
+                _ocr_executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+    return _ocr_executor
+
+
+# Cap the OpenMP threads of tesseract subprocesses only, the detector keeps its own threads
+def limit_tesseract_threads(threads=TESSERACT_OMP_THREADS):
+    pytesseract.pytesseract.environ = {**os.environ, "OMP_THREAD_LIMIT": str(threads)}
+
+
+# OCR a single preprocessed crop
+def ocr_crop(preprocessed, label):
+    if label not in NUMERIC_LABELS:
+        return pytesseract.image_to_string(preprocessed, lang="eng")
+    return pytesseract.image_to_string(preprocessed, config=NUMERIC_CONFIG)
+
+
+def timed_ocr_crop(preprocessed, label):
+    with metrics.timed("ocr_crop", "cvip_ocr_seconds", label=label):
+        return ocr_crop(preprocessed, label)
+
+
+def _ocr_box(binary, box, label):
+    preprocessed = crop_for_ocr(binary, box)
+    if preprocessed.size == 0:
+        return ""
+    if not field_cache.handles(label):
+        return timed_ocr_crop(preprocessed, label)
+
+    # Recurring header regions hash to the same key and skip tesseract
+    key = perceptual_hash(preprocessed)
+    text = field_cache.get(label, key)
+    if text is None:
+        text = timed_ocr_crop(preprocessed, label)
+        field_cache.put(label, key, text)
+    return text
+
+
+# Stack binarized crops vertically on a white canvas
+def build_mosaic(crops, margin=MOSAIC_MARGIN):
+    width = max(crop.shape[1] for crop in crops) + 2 * margin
+    height = sum(crop.shape[0] for crop in crops) + (len(crops) + 1) * margin
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+
+    tops = []
+    y = margin
+    for crop in crops:
+        canvas[y:y + crop.shape[0], margin:margin + crop.shape[1]] = crop
+        tops.append(y)
+        y += crop.shape[0] + margin
+    return canvas, tops
+
+
+# Split crops into groups whose mosaic stays below the maximum height
+def _mosaic_groups(crops, max_height=MOSAIC_MAX_HEIGHT, margin=MOSAIC_MARGIN):
+    group, height = [], margin
+    for index, crop in enumerate(crops):
+        if group and height + crop.shape[0] + margin > max_height:
+            yield group
+            group, height = [], margin
+        group.append(index)
+        height += crop.shape[0] + margin
+    if group:
+        yield group
+
+
+# OCR many crops with one tesseract call per mosaic
+def ocr_mosaic(crops, config=TEXT_CONFIG, lang="eng"):
+    """
+    Packs crops into a single canvas, runs tesseract once and maps every
+    recognised word back to the crop it came from.
+    Args:
+        crops (list): Preprocessed single-channel crops.
+        config (str): Extra tesseract configuration.
+        lang (str): Tesseract language.
+    Returns:
+        list: The text of each crop, lines joined with newlines.
+    """
+    texts = [""] * len(crops)
+    for group in _mosaic_groups(crops):
+        canvas, tops = build_mosaic([crops[i] for i in group])
+        data = pytesseract.image_to_data(
+            canvas, lang=lang, config=config, output_type=pytesseract.Output.DICT
+        )
+
+        # Words belong to the crop whose band (padded by half a margin) holds their centre
+        bounds = np.asarray(tops) - MOSAIC_MARGIN // 2
+        lines = {}
+        for i, word in enumerate(data["text"]):
+            if not word.strip():
+                continue
+            centre = data["top"][i] + data["height"][i] / 2
+            slot = max(int(np.searchsorted(bounds, centre, side="right")) - 1, 0)
+            key = (slot, data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append((data["left"][i], word))
+
+        # Tesseract reports lines in reading order, so insertion order is preserved
+        per_crop = {}
+        for (slot, *_), words in lines.items():
+            per_crop.setdefault(slot, []).append(" ".join(w for _, w in sorted(words)))
+        for slot, crop_lines in per_crop.items():
+            texts[group[slot]] = "\n".join(crop_lines)
+    return texts
+
+
+# Packed calls are timed per kind, their fields share one tesseract run
+def _timed_mosaic(crops, config, kind):
+    with metrics.timed("ocr_mosaic", "cvip_ocr_seconds", label=f"mosaic_{kind}"):
+        return ocr_mosaic(crops, config)
+
+
+# Batched OCR over the boxes of one or more pages
+def extract_text_batched(pages, executor=None):
+    """
+    OCRs the boxes of several pages with one packed tesseract call for text
+    fields and one for numeric fields, which keep their digit whitelist.
+    Args:
+        pages (list): (image, boxes, labels) tuples.
+        executor: Pool used to run the text and numeric calls side by side.
+    Returns:
+        list: One extracted data dict per page.
+    """
+    executor = executor or get_ocr_executor()
+    crops = {"text": [], "numeric": []}
+    cache_keys = {"text": [], "numeric": []}
+    order = []  # (page, label, kind, index into crops[kind] or cached text) in detection order
+    for page_index, (image, boxes, labels) in enumerate(pages):
+        with metrics.timed("binarize"):
+            binary = binarize_page(image)
+        for box, label in zip(boxes, labels):
+            kind = "numeric" if label in NUMERIC_LABELS else "text"
+            preprocessed = crop_for_ocr(binary, box)
+            if preprocessed.size == 0:
+                order.append((page_index, label, kind, ""))
+                continue
+
+            # Cached header regions stay out of the mosaic
+            key = perceptual_hash(preprocessed) if field_cache.handles(label) else None
+            cached = field_cache.get(label, key) if key else None
+            if cached is not None:
+                order.append((page_index, label, kind, cached))
+                continue
+            crops[kind].append(preprocessed)
+            cache_keys[kind].append((label, key))
+            order.append((page_index, label, kind, len(crops[kind]) - 1))
+
+    configs = {"text": TEXT_CONFIG, "numeric": NUMERIC_CONFIG}
+    futures = {
+        kind: executor.submit(_timed_mosaic, kind_crops, configs[kind], kind)
+        for kind, kind_crops in crops.items()
+        if kind_crops
+    }
+    texts = {kind: future.result() for kind, future in futures.items()}
+    for kind, keys in cache_keys.items():
+        for (label, key), text in zip(keys, texts.get(kind, [])):
+            if key:
+                field_cache.put(label, key, text)
+
+    results = [{} for _ in pages]
+    for page_index, label, kind, entry in order:
+        text = entry if isinstance(entry, str) else texts[kind][entry]
+        results[page_index].setdefault(label, []).append(text.strip())
+    return results
 
 
 # Extract text using Tesseract
-def extract_text_from_boxes(image, boxes, labels):
+def extract_text_from_boxes(image, boxes, labels, executor=None):
+    if OCR_MODE == "batched":
+        return extract_text_batched([(image, boxes, labels)], executor)[0]
+
+    executor = executor or get_ocr_executor()
+    with metrics.timed("binarize"):
+        binary = binarize_page(image)
+    futures = [executor.submit(_ocr_box, binary, box, label) for box, label in zip(boxes, labels)]
+
+    # Collect in submission order so each label keeps its detection order
     extracted_data = {}
-    for box, label in zip(boxes, labels):
-        x1, y1, x2, y2 = map(int, box)
-        cropped = image[y1:y2, x1:x2]
-        preprocessed = preprocess_image(cropped)
-        text = (
-            pytesseract.image_to_string(preprocessed, lang="eng")
-            if label not in ["quantity", "rate"]
-            else pytesseract.image_to_string(
-                preprocessed, config="--psm 6 -c tessedit_char_whitelist=0123456789."
-            )
-        )
-        extracted_data.setdefault(label, []).append(text.strip())
-    raw_json_path = os.path.join("json_raw", "001__raw.json")
-    os.makedirs("json_raw", exist_ok=True)
-    with open(raw_json_path, "w") as f:
-        json.dump(extracted_data, f, indent=4)
+    for future, label in zip(futures, labels):
+        extracted_data.setdefault(label, []).append(future.result().strip())
     return extracted_data
 
+# Bump whenever OCR preprocessing or clean_extracted_data changes its output, cached results are keyed on it
+CLEANER_VERSION = "2"
+
+
+# Cleaner version plus every setting that changes the extracted text, the result cache keys on it
+def extraction_settings():
+    return (
+        f"{CLEANER_VERSION};ocr_mode={OCR_MODE};pdf_dpi={PDF_DPI};pdf_max_page_pixels={PDF_MAX_PAGE_PIXELS};"
+        f"detect_max_side={DETECT_MAX_SIDE};text_height={OCR_MIN_TEXT_HEIGHT}-{OCR_TARGET_TEXT_HEIGHT}"
+    )
+
+
 def clean_extracted_data(raw_data):
     # Define all expected keys and their default values
     expected_keys = {
@@ -117,52 +431,56 @@ def clean_extracted_data(raw_data):
 
 
 # Load model
-def load_model(model_path):
+def load_model(model_path, intra_op_num_threads=ONNX_INTRA_OP_THREADS,
+               graph_optimization_level=ONNX_GRAPH_OPTIMIZATION):
     if model_path.endswith('.pt'):
+        if YOLO is None:
+            raise ImportError("ultralytics is required to load .pt models, export to .onnx instead.")
         return YOLO(model_path)
     elif model_path.endswith('.onnx'):
-        return ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        return onnx_engine.create_session(model_path, intra_op_num_threads, graph_optimization_level)
     else:
         raise ValueError("Unsupported model format.")
 
 
-# Run inference
-def run_inference(model, image_path):
-    if isinstance(model, YOLO):
-        results = model(image_path)
-        boxes = results[0].boxes.xyxy.cpu().numpy().tolist()
-        labels = [model.names[int(cls)] for cls in results[0].boxes.cls.cpu()]
-    elif isinstance(model, ort.InferenceSession):
-        image, _ = preprocess_for_onnx(image_path)
-        outputs = model.run(None, {model.get_inputs()[0].name: image})
-        boxes, labels = process_onnx_output(outputs)
-    else:
-        raise ValueError("Unsupported model type.")
-    return boxes, labels
-
-
-# Preprocess image for ONNX
-def preprocess_for_onnx(image_path, input_shape=(640, 640)):
-    original_image = cv2.imread(image_path)
-    if original_image is None:
-        raise ValueError(f"Image not found at path: {image_path}")
-    image = cv2.resize(original_image, input_shape)
-    image = image.astype(np.float32) / 255.0
-    image = np.transpose(image, (2, 0, 1))
-    image = np.expand_dims(image, axis=0)
-    return image, original_image
-
-
-# Process ONNX output
-def process_onnx_output(outputs, confidence_threshold=0.5):
-    boxes, labels = [], []
-    for output in outputs:
-        for box in output['boxes']:
-            confidence = box[4]
-            if confidence > confidence_threshold:
-                boxes.append(box[:4].tolist())
-                labels.append(int(box[5]))
-    return boxes, labels
+# Decode an image file once, arrays pass through untouched
+def load_image(image):
+    if isinstance(image, np.ndarray):
+        return image
+    with metrics.timed("image_decode"):
+        decoded = cv2.imread(image)
+    if decoded is None:
+        raise ValueError(f"Image not found at path: {image}")
+    return decoded
+
+
+# Run inference on several images in one forward pass
+def run_inference_batch(model, images):
+    # A model path borrows the resident model from the registry
+    if isinstance(model, str):
+        with registry.borrow(model) as resident:
+            return run_inference_batch(resident, images)
+
+    images = [load_image(image) for image in images]
+    detections = []
+    with metrics.timed("inference"):
+        if YOLO is not None and isinstance(model, YOLO):
+            for result in model(images, batch=len(images)):
+                boxes = result.boxes.xyxy.cpu().numpy().tolist()
+                labels = [model.names[int(cls)] for cls in result.boxes.cls.cpu()]
+                detections.append((boxes, labels))
+        elif isinstance(model, ort.InferenceSession):
+            names = onnx_engine.class_names(model)
+            for boxes, _, class_ids in onnx_engine.detect_batch(model, images):
+                detections.append((boxes.tolist(), [names[int(cls)] for cls in class_ids]))
+        else:
+            raise ValueError("Unsupported model type.")
+    return detections
+
+
+# Run inference on an image array or file path
+def run_inference(model, image):
+    return run_inference_batch(model, [image])[0]
 
 
 # Draw bounding boxes
@@ -173,67 +491,438 @@ def draw_boxes(image, boxes, labels, class_names):
         cv2.putText(image, class_names[label], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
 
-# Function to convert PDF to JPEG
-def convert_pdf_to_jpeg(pdf_path, output_folder):
-    images = convert_from_path(pdf_path, dpi=300)
-    jpeg_paths = []
-    for i, image in enumerate(images):
-        jpeg_path = os.path.join(output_folder, f"{os.path.splitext(os.path.basename(pdf_path))[0]}_{i+1}.jpeg")
-        image.save(jpeg_path, 'JPEG')
-        jpeg_paths.append(jpeg_path)
-    return jpeg_paths
+# Pick the DPI for a document, oversized pages are rendered lower to keep within the pixel budget
+def pdf_dpi(info, dpi=PDF_DPI, max_pixels=PDF_MAX_PAGE_PIXELS):
+    match = re.match(r"\s*([\d.]+) x ([\d.]+)", str(info.get("Page size", "")))
+    if not match:
+        return dpi
+    width_in, height_in = float(match.group(1)) / 72, float(match.group(2)) / 72
+    budget_dpi = int((max_pixels / (width_in * height_in)) ** 0.5)
+    return max(min(dpi, budget_dpi), 72)
+
+
+# Rasterize a PDF a few pages at a time into BGR page arrays
+def iter_pdf_pages(pdf_path, dpi=None, window=PDF_PAGE_WINDOW, thread_count=PDF_THREADS):
+    """
+    Streams the pages of a PDF so only `window` rendered pages are held at once.
+    Args:
+        pdf_path (str): Path to the PDF file.
+        dpi (int): Rendering resolution, None applies the per-document policy.
+        window (int): Pages rendered per poppler call.
+        thread_count (int): Poppler threads used for each call.
+    Yields:
+        tuple: (page_number, page_count, image) with the image as a BGR array.
+    """
+    info = pdfinfo_from_path(pdf_path)
+    page_count = int(info["Pages"])
+    dpi = dpi or pdf_dpi(info)
+
+    for first in range(1, page_count + 1, window):
+        last = min(first + window - 1, page_count)
+        with metrics.timed("pdf_rasterize"):
+            rendered = convert_from_path(
+                pdf_path, dpi=dpi, first_page=first, last_page=last,
+                thread_count=min(thread_count, last - first + 1),
+            )
+            images = []
+            for page in rendered:
+                images.append(cv2.cvtColor(np.asarray(page.convert("RGB")), cv2.COLOR_RGB2BGR))
+                page.close()
+        for offset, image in enumerate(images):
+            yield first + offset, page_count, image
+
+
+# Rasterize a whole PDF into BGR page arrays
+def convert_pdf_to_images(pdf_path, dpi=None):
+    return [image for _, _, image in iter_pdf_pages(pdf_path, dpi)]
+
+
+# Downscale a page for the detector, returns the view and the factor boxes must be divided by
+def detection_view(image, max_side=DETECT_MAX_SIDE):
+    scale = max_side / max(image.shape[:2])
+    if scale >= 1:
+        return image, 1.0
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
 
 
 # Main processing pipeline
-def process_image(image_path, output_folder, model):
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Failed to read image: {image_path}")
-        return
+def process_batch(pages, output_folder, model=DEFAULT_MODEL_PATH):
+    """
+    Detects fields on a batch of decoded pages with one forward pass, then
+    OCRs, cleans and saves each page.
+    Args:
+        pages (list): (name, image) tuples, images as BGR arrays.
+        output_folder (str): Folder the cleaned JSON files are written to.
+        model: Model path (borrowed from the registry) or a loaded model.
+    Returns:
+        list: The JSON path of each page.
+    """
+    if not pages:
+        return []
+
+    # Detect on reduced views and map the boxes back onto the full-resolution pages
+    views = [detection_view(image) for _, image in pages]
+    detections = run_inference_batch(model, [view for view, _ in views])
+    detected = [
+        (image, [[coord / scale for coord in box] for box in boxes], labels)
+        for (_, image), (_, scale), (boxes, labels) in zip(pages, views, detections)
+    ]
+
+    metrics.inc("cvip_pages_total", len(pages))
+    for _, boxes, labels in detected:
+        metrics.observe("cvip_boxes_per_page", len(boxes))
+        for label in labels:
+            metrics.inc("cvip_boxes_total", label=label)
+
+    # Batched OCR packs every page of the batch into the same tesseract calls
+    with metrics.timed("ocr"):
+        if OCR_MODE == "batched":
+            extracted = extract_text_batched(detected)
+        else:
+            extracted = [extract_text_from_boxes(*page) for page in detected]
 
-    boxes, labels = run_inference(model, image_path)
-    extracted_text = extract_text_from_boxes(image, boxes, labels)
-    cleaned_text = clean_extracted_data(extracted_text)
+    json_paths = []
+    for (name, _), extracted_text in zip(pages, extracted):
+        if OCR_DUMP_RAW:
+            with open(os.path.join(output_folder, f"{name}__raw.json"), "w") as f:
+                json.dump(extracted_text, f, indent=4)
 
-    json_path = os.path.join(output_folder, f"{os.path.splitext(os.path.basename(image_path))[0]}__ocr.json")
-    with open(json_path, "w") as f:
-        json.dump(cleaned_text, f, indent=4)
+        with metrics.timed("clean"):
+            cleaned_text = clean_extracted_data(extracted_text)
 
-    print(f"Processed: {image_path}")
-    print(f"Cleaned data saved to: {json_path}")
+        json_path = os.path.join(output_folder, f"{name}__ocr.json")
+        with metrics.timed("json_write"), open(json_path, "w") as f:
+            json.dump(cleaned_text, f, indent=4)
+        json_paths.append(json_path)
 
+        info_logger.info(f"Processed {name}, cleaned data saved to {json_path}",
+                         extra={"page": name, "sampled": True})
+    return json_paths
+
+
+def page_name(name, file_path, page_number=1):
+    """Base name of one page's JSON file, PDF pages are numbered even when there is only one."""
+    if file_path.lower().endswith('.pdf'):
+        return f"{name}_{page_number}"
+    return name
 
-# Main function
-def main():
-    input_folder = "uploads"
-    output_folder = "json"
-    model_path = "model/best.pt"
 
+# Write already cleaned pages of a document as JSON files, named as process_file names them
+def write_pages(pages, file_path, output_folder, name=None):
     os.makedirs(output_folder, exist_ok=True)
-    files = os.listdir(input_folder)
-    model = load_model(model_path)
-    
-    # Handle PDF files
-    for file in files:
-        file_path = os.path.join(input_folder, file)
-        if file.lower().endswith('.pdf'):
-            # Convert PDF to JPEG and process the images
-            jpeg_paths = convert_pdf_to_jpeg(file_path, output_folder)
-            for jpeg_path in jpeg_paths:
-                process_image(jpeg_path, output_folder, model)
-                os.remove(jpeg_path)  # Remove the JPEG after processing
+    name = name or os.path.splitext(os.path.basename(file_path))[0]
+    json_paths = []
+    for page_number, cleaned_text in enumerate(pages, start=1):
+        json_path = os.path.join(output_folder, f"{page_name(name, file_path, page_number)}__ocr.json")
+        with open(json_path, "w") as f:
+            json.dump(cleaned_text, f, indent=4)
+        json_paths.append(json_path)
+    return json_paths
+
+
+def process_image(image_path, output_folder, model=DEFAULT_MODEL_PATH, name=None):
+    with metrics.timed("image_decode"):
+        image = cv2.imread(image_path)
+    if image is None:
+        error_logger.error(f"Failed to read image: {image_path}")
+        return
+    name = name or os.path.splitext(os.path.basename(image_path))[0]
+    return process_batch([(name, image)], output_folder, model)[0]
+
+
+# Process one uploaded image or PDF and delete it afterwards
+def process_file(file_path, output_folder, model=DEFAULT_MODEL_PATH, progress=None, delete=True, name=None):
+    """
+    Runs detection and OCR on every page of an uploaded file.
+    Args:
+        file_path (str): Path to an image or PDF file.
+        output_folder (str): Folder the cleaned JSON files are written to.
+        model: Model path (borrowed from the registry) or a loaded model.
+        progress (callable): Optional callback receiving (pages_done, pages_total).
+        delete (bool): Remove the file once processed.
+        name (str): Base name of the JSON files, defaults to the file name without extension.
+    Returns:
+        list: Paths of the JSON files written, one per page.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    json_paths = []
+    name = name or os.path.splitext(os.path.basename(file_path))[0]
+
+    if file_path.lower().endswith('.pdf'):
+        # Pages are streamed and stay decoded in memory from rasterization to OCR
+        batch = []
+        for page_number, page_count, image in iter_pdf_pages(file_path):
+            batch.append((page_name(name, file_path, page_number), image))
+            if len(batch) == DETECT_BATCH_SIZE or page_number == page_count:
+                json_paths.extend(process_batch(batch, output_folder, model))
+                batch = []
+                if progress:
+                    progress(page_number, page_count)
+        if delete:
             os.remove(file_path)  # Remove the original PDF file
-            print(f"Processed and deleted PDF: {file_path}")
-
-        # Handle image files
-        elif file.lower().endswith(('jpg', 'jpeg', 'png', 'tiff', 'bmp', 'webp')):
-            process_image(file_path, output_folder, model)
+        info_logger.info(f"Processed PDF: {file_path}", extra={"pages": len(json_paths)})
+
+    # Handle image files
+    elif file_path.lower().endswith(IMAGE_EXTENSIONS):
+        json_path = process_image(file_path, output_folder, model, page_name(name, file_path))
+        if json_path:
+            json_paths.append(json_path)
+        if delete:
             os.remove(file_path)
-            print(f"Processed and deleted image: {file_path}")
-
-    results = json_to_db()
+        if progress:
+            progress(1, 1)
+        info_logger.info(f"Processed image: {file_path}", extra={"pages": len(json_paths)})
+
+    return json_paths
+
+
+
+
+# Batch command: shards a folder of scans across worker processes
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def find_documents(input_folder):
+    """Paths, relative to `input_folder`, of every image and PDF below it in sorted order."""
+    documents = []
+    for root, _, files in os.walk(input_folder):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS + ('.pdf',)):
+                documents.append(os.path.relpath(os.path.join(root, file), input_folder))
+    return sorted(documents)
+
+
+def output_names(documents):
+    """
+    Base name of the JSON files of each document: the file name without
+    extension, with the extension appended when another document of the
+    same folder shares the stem (a.jpg and a.png become a_jpg and a_png).
+    """
+    stems = {}
+    for document in documents:
+        stem, _ = os.path.splitext(document)
+        stems.setdefault(stem, []).append(document)
+    names = {}
+    for stem, group in stems.items():
+        for document in group:
+            name = os.path.basename(stem)
+            if len(group) > 1:
+                name = f"{name}_{os.path.splitext(document)[1].lstrip('.')}"
+            names[document] = name
+    return names
+
+
+def read_manifest(manifest_path):
+    """Latest manifest entry of every file, a line torn by an interrupted run is ignored."""
+    entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry["file"]] = entry
+    return entries
+
+
+def _fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def _is_finished(entry, fingerprint, version, retry_failed):
+    # A file that changed, or a different model, gets processed again
+    if entry is None or entry.get("model_version") != version:
+        return False
+    if any(entry.get(key) != value for key, value in fingerprint.items()):
+        return False
+    return entry["status"] == "done" or not retry_failed
+
+
+def batch_tasks(documents, batch_size=DETECT_BATCH_SIZE):
+    """Groups documents into worker tasks: each PDF alone, images of one folder up to `batch_size` together."""
+    images = []
+    for document in documents:
+        if document.lower().endswith('.pdf'):
+            yield [document]
+            continue
+        if images and (len(images) == batch_size or os.path.dirname(images[0]) != os.path.dirname(document)):
+            yield images
+            images = []
+        images.append(document)
+    if images:
+        yield images
+
+
+def _init_batch_worker(model_path):
+    registry.get(model_path)  # Each worker keeps its own resident model
+
+
+def process_documents(documents, input_folder, output_folder, model_path=DEFAULT_MODEL_PATH, delete=False,
+                      names=None):
+    """
+    Worker task of the batch command. Images share one detection batch,
+    when the batch fails every document is retried alone so a bad file only fails itself.
+    Args:
+        documents (list): Paths relative to `input_folder`, all in the same folder.
+        input_folder (str): Folder being processed.
+        output_folder (str): JSON files are written to the same relative folder below it.
+        model_path (str): Model borrowed from the registry.
+        delete (bool): Remove inputs once processed.
+        names (dict): Base name of the JSON files per document, see `output_names`.
+    Returns:
+        list: (document, json paths, error) per document.
+    """
+    names = names or output_names(documents)
+    output = os.path.join(output_folder, os.path.dirname(documents[0]))
+    os.makedirs(output, exist_ok=True)
+
+    if len(documents) > 1:
+        try:
+            pages, results = [], []
+            for document in documents:
+                image = cv2.imread(os.path.join(input_folder, document))
+                if image is None:
+                    results.append((document, [], "could not decode image"))
+                else:
+                    pages.append((document, image))
+            json_paths = process_batch(
+                [(names[document], image) for document, image in pages],
+                output, model_path,
+            )
+            for (document, _), json_path in zip(pages, json_paths):
+                results.append((document, [json_path], None))
+                if delete:
+                    os.remove(os.path.join(input_folder, document))
+            return results
+        except Exception as e:
+            error_logger.error(f"Batch of {len(documents)} images failed, retrying one by one: {e}")
+
+    results = []
+    for document in documents:
+        try:
+            json_paths = process_file(
+                os.path.join(input_folder, document), output, model_path, delete=delete, name=names[document]
+            )
+            results.append((document, json_paths, None if json_paths else "no page could be read"))
+        except Exception as e:
+            results.append((document, [], f"{type(e).__name__}: {e}"))
     return results
 
 
+def run_tasks(pool, fn, tasks, max_pending):
+    """Submits tasks with at most `max_pending` in flight and yields their results as they complete."""
+    pending = set()
+    try:
+        for task in tasks:
+            pending.add(pool.submit(fn, *task))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# Main function
+def main():
+    """Extracts a folder of scans, e.g. `python -m utils.pipelline --input scans --output json --workers 8`."""
+    parser = argparse.ArgumentParser(description="Extract invoices from a folder of images and PDFs")
+    parser.add_argument("--input", default="uploads", help="Folder of images and PDFs, searched recursively")
+    parser.add_argument("--output", default="json", help="Folder the JSON files and the manifest are written to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Detector weights, .pt or .onnx")
+    parser.add_argument("--manifest", help=f"Progress file, defaults to OUTPUT/{MANIFEST_NAME}")
+    parser.add_argument("--retry-failed", action="store_true", help="Process files that failed before again")
+    parser.add_argument("--delete", action="store_true", help="Remove inputs once processed")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input):
+        parser.error(f"input folder not found: {args.input}")
+    if not os.path.exists(args.model):
+        parser.error(f"model not found: {args.model}")
+    version = model_version(args.model)
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output, MANIFEST_NAME)
+
+    # Resume: files finished by an earlier run with the same model are skipped
+    entries = read_manifest(manifest_path)
+    documents = find_documents(args.input)
+    fingerprints = {document: _fingerprint(os.path.join(args.input, document)) for document in documents}
+    pending = [
+        document for document in documents
+        if not _is_finished(entries.get(document), fingerprints[document], version, args.retry_failed)
+    ]
+    skipped_failed = sum(
+        1 for document in set(documents) - set(pending) if entries[document]["status"] == "failed"
+    )
+    message = f"{len(documents)} documents, {len(documents) - len(pending) - skipped_failed} already done, "
+    if skipped_failed:
+        message += f"{skipped_failed} skipped after failing before (--retry-failed processes them), "
+    print(message + f"{len(pending)} to process with {args.workers} worker(s)", file=sys.stderr)
+    if not pending:
+        return
+
+    # Split the cores between the workers unless set explicitly, spawned workers read these on import
+    threads = str(max((os.cpu_count() or 1) // args.workers, 1))
+    for variable in ("ONNX_INTRA_OP_THREADS", "OCR_WORKERS", "OMP_NUM_THREADS"):
+        os.environ.setdefault(variable, threads)
+
+    started = last_report = time.perf_counter()
+    done = pages = failed = 0
+    # Names come from every document found, so a resumed run names its outputs the same way
+    names = output_names(documents)
+    tasks = (
+        (task, args.input, args.output, args.model, args.delete, {document: names[document] for document in task})
+        for task in batch_tasks(pending)
+    )
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_batch_worker, initargs=(args.model,),
+    )
+    try:
+        with open(manifest_path, "a") as manifest:
+            for results in run_tasks(pool, process_documents, tasks, 2 * args.workers):
+                for document, json_paths, error in results:
+                    entry = {
+                        "file": document,
+                        **fingerprints[document],
+                        "model_version": version,
+                        "status": "failed" if error else "done",
+                        "outputs": json_paths,
+                    }
+                    if error:
+                        entry["error"] = error
+                        failed += 1
+                        print(f"Failed: {document}: {error}", file=sys.stderr)
+                    manifest.write(json.dumps(entry) + "\n")
+                    done += 1
+                    pages += len(json_paths)
+                manifest.flush()
+
+                now = time.perf_counter()
+                if now - last_report >= 10:
+                    last_report = now
+                    elapsed = now - started
+                    print(f"{done}/{len(pending)} documents, {pages} pages, {pages / elapsed:.2f} pages/s, "
+                          f"{failed} failed", file=sys.stderr)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print("Interrupted, run the same command again to resume.", file=sys.stderr)
+        sys.exit(130)
+    pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"Processed {done} documents ({pages} pages) in {elapsed:.1f}s: {done / elapsed:.2f} documents/s, "
+          f"{pages / elapsed:.2f} pages/s, {failed} failed", file=sys.stderr)
+
+
 if __name__ == "__main__":
     main()
@@ -1,117 +1,230 @@
 import os
 import json
+import time
 from flask import current_app
+from sqlalchemy import insert
 from utils.models import db, Invoice, Product
+from utils.summary import record_invoices, summary_entry
+from utils.dates import parse_invoice_date
+from utils import metrics
 
-def json_to_db():
+# Documents stored per transaction
+JSON_BATCH_SIZE = int(os.environ.get("JSON_BATCH_SIZE", 200))
+
+
+def clean_float(value):
     """
-    Reads all JSON files in the current directory, parses their content,
-    and stores the data in the database.
+    Cleans and converts a string to a float. Removes invalid characters like '/'.
+    Args:
+        value (str): Input value to clean and convert.
+    Returns:
+        float: Cleaned float value, or 0.0 if conversion fails.
+    """
+    try:
+        # Remove invalid characters
+        cleaned_value = value.replace(",", "").replace("/", "").strip()
+        return float(cleaned_value)
+    except ValueError:
+        return 0.0
+
+
+def extract_first_or_join(value):
+    """
+    Extracts the first element of a list or joins elements into a single string.
+    If the value is not a list, return it as is.
+    Args:
+        value: Input value (list or string).
+    Returns:
+        str: Single string representation.
+    """
+    if isinstance(value, list):
+        return value[0] if len(value) == 1 else ", ".join(value)
+    return value
+
+
+def parse_invoice(json_data):
     """
-    def clean_float(value):
-        """
-        Cleans and converts a string to a float. Removes invalid characters like '/'.
-        Args:
-            value (str): Input value to clean and convert.
-        Returns:
-            float: Cleaned float value, or 0.0 if conversion fails.
-        """
+    Maps one OCR result onto invoice and product rows.
+    Args:
+        json_data (dict): Cleaned extraction result of one page.
+    Returns:
+        dict: The invoice row, its product rows (without invoice_id) and its summary entry.
+    """
+    # Calculate totals
+    total_amount_excluding_tax = sum(clean_float(x) for x in json_data.get("excl", []))
+    total_sales_tax = sum(clean_float(x) for x in json_data.get("sales", []))
+    total_amount_including_tax = total_amount_excluding_tax + total_sales_tax
+
+    invoice = {
+        "ntn": json_data.get("supplierNTN", ""),
+        "name": json_data.get("supplierName", ""),
+        "st_reg_no": json_data.get("supplierSTN", ""),
+        "address": json_data.get("supplierAddress", ""),
+        "customer_receipt_no": json_data.get("serialNumber", 0),
+        "customer_ntn": extract_first_or_join(json_data.get("buyerNTN", "")),
+        "customer_name": json_data.get("buyerName", ""),
+        "customer_st_reg_no": json_data.get("buyerSTN", ""),
+        "customer_phone_number": json_data.get("buyerContact", ""),
+        "customer_address": json_data.get("buyerAddress", ""),
+        "business_name": json_data.get("businessName", [""])[0],
+        "date": json_data.get("date", ""),
+        "invoice_date": parse_invoice_date(json_data.get("date", "")),
+        "total_amount_excluding_tax": total_amount_excluding_tax,
+        "total_sales_tax": total_sales_tax,
+        "total_amount_including_tax": total_amount_including_tax,
+    }
+
+    products = []
+    for product_name, quantity, rate, excl, sales, incl in zip(
+        json_data.get("products", []),
+        json_data.get("quantity", []),
+        json_data.get("rate", []),
+        json_data.get("excl", []),
+        json_data.get("sales", []),
+        json_data.get("incl", []),
+    ):
+        if product_name:  # Only create product if product_name is not empty
+            products.append({
+                "product_name": product_name,
+                "quantity": int(clean_float(quantity) if quantity else 0),
+                "rate": int(clean_float(rate) if rate else 0),
+                "tax": clean_float(sales) if sales else 0.0,
+                "price_with_tax": int(clean_float(incl) if incl else 0),
+                "amount_excluding_tax": clean_float(excl) if excl else 0.0,
+                "sales_tax": clean_float(sales) if sales else 0.0,
+                "amount_including_tax": clean_float(incl) if incl else 0.0,
+            })
+
+    entry = summary_entry(invoice["name"], invoice["customer_name"], [p["product_name"] for p in products])
+    return {"invoice": invoice, "products": products, "summary": entry}
+
+
+def insert_documents(session, documents):
+    """
+    Inserts parsed documents with multi-row core inserts and updates the summary.
+    Args:
+        session: The SQLAlchemy session, the caller owns the transaction.
+        documents (list): Dicts built by `parse_invoice`.
+    Returns:
+        int: Number of invoice and product rows inserted.
+    """
+    # RETURNING in parameter order maps every generated id back to its document
+    invoice_ids = session.execute(
+        insert(Invoice.__table__).returning(Invoice.__table__.c.id, sort_by_parameter_order=True),
+        [document["invoice"] for document in documents],
+    ).scalars().all()
+
+    products = [
+        dict(product, invoice_id=invoice_id)
+        for invoice_id, document in zip(invoice_ids, documents)
+        for product in document["products"]
+    ]
+    if products:
+        session.execute(insert(Product.__table__), products)
+
+    # Keep the dashboard highlights in step, in the same transaction
+    record_invoices(session, [document["summary"] for document in documents])
+    return len(invoice_ids) + len(products)
+
+
+def _store_batch(batch):
+    """
+    Stores one batch of (file_path, document) pairs in a single transaction.
+    When the batch fails as a whole it is retried one document per savepoint,
+    so a bad document only loses itself.
+    Returns:
+        tuple: Stored file paths, failed (file_path, error) pairs and rows inserted.
+    """
+    try:
+        rows = insert_documents(db.session, [document for _, document in batch])
+        db.session.commit()
+        return [file_path for file_path, _ in batch], [], rows
+    except Exception as e:
+        db.session.rollback()
+        current_app.error_logger.error(f"Batch insert failed, retrying per document: {e}")
+
+    stored, failed, rows = [], [], 0
+    for file_path, document in batch:
         try:
-            # Remove invalid characters
-            cleaned_value = value.replace(",", "").replace("/", "").strip()
-            return float(cleaned_value)
-        except ValueError:
-            return 0.0
-
-    def extract_first_or_join(value):
-        """
-        Extracts the first element of a list or joins elements into a single string.
-        If the value is not a list, return it as is.
-        Args:
-            value: Input value (list or string).
-        Returns:
-            str: Single string representation.
-        """
-        if isinstance(value, list):
-            return value[0] if len(value) == 1 else ", ".join(value)
-        return value
+            with db.session.begin_nested():
+                rows += insert_documents(db.session, [document])
+            stored.append(file_path)
+        except Exception as e:
+            failed.append((file_path, e))
+    db.session.commit()
+    return stored, failed, rows
+
+
+def store_json_files(files, batch_size=JSON_BATCH_SIZE):
+    """
+    Stores JSON files in batches of `batch_size`, one transaction per batch.
+    Stored files are deleted once committed, files that fail are kept.
+    Args:
+        files (list): JSON file paths.
+        batch_size (int): Documents per transaction.
+    Returns:
+        tuple: Stored file paths and failed (file_path, error) pairs.
+    """
+    started = time.perf_counter()
+    stored_files, failed, rows = [], [], 0
+    for start in range(0, len(files), batch_size):
+        # Parse the batch first, unreadable files never reach the database
+        batch = []
+        for file_path in files[start:start + batch_size]:
+            try:
+                with open(file_path, 'r') as f:
+                    batch.append((file_path, parse_invoice(json.load(f))))
+            except Exception as e:
+                failed.append((file_path, e))
 
+        with metrics.timed("db_insert"):
+            stored, batch_failed, batch_rows = _store_batch(batch) if batch else ([], [], 0)
+        failed.extend(batch_failed)
+        for file_path in stored:
+            os.remove(file_path)
+        stored_files.extend(stored)
+        rows += batch_rows
+
+        elapsed = time.perf_counter() - started
+        current_app.info_logger.info(
+            f"Stored {len(stored_files)}/{len(files)} JSON files, {rows} rows in {elapsed:.2f}s "
+            f"({rows / max(elapsed, 1e-9):.0f} rows/s).",
+            extra={"stage": "db_insert", "rows": rows, "duration_ms": round(elapsed * 1000, 3), "sampled": True},
+        )
+
+    metrics.inc("cvip_db_rows_total", rows)
+    metrics.inc("cvip_db_failed_documents_total", len(failed))
+    for file_path, error in failed:
+        current_app.error_logger.error(f"Error processing JSON {file_path}: {error}", extra={"document": file_path})
+    return stored_files, failed
+
+
+def json_to_db(files=None, batch_size=JSON_BATCH_SIZE):
+    """
+    Reads all JSON files in the current directory, parses their content,
+    and stores the data in the database.
+    Args:
+        files (list): Optional JSON file paths to store instead of the whole directory.
+        batch_size (int): Documents per transaction.
+    """
     try:
-        path = 'json'   # dir
-        if not os.path.exists(path):
-            current_app.info_logger.info("JSON directory not found.")
-            return "JSON directory not found."
+        if files is None:
+            path = 'json'   # dir
+            if not os.path.exists(path):
+                current_app.info_logger.info("JSON directory not found.")
+                return "JSON directory not found."
 
-        files = [file for file in os.listdir(path) if file.endswith('.json')]
+            files = [os.path.join(path, file) for file in os.listdir(path) if file.endswith('.json')]
         if not files:
             current_app.info_logger.info("No JSON files found in the directory.")
             return "No JSON files found."
 
-        # Process each JSON file
-        for file in files:
-            file_path = os.path.join(path, file)
-            current_app.info_logger.info(f"Processing JSON file: {file_path}")
-            with open(file_path, 'r') as f:
-                json_data = json.load(f)
-
-            # Calculate totals
-            total_amount_excluding_tax = sum(clean_float(x) for x in json_data.get("excl", []))
-            total_sales_tax = sum(clean_float(x) for x in json_data.get("sales", []))
-            total_amount_including_tax = total_amount_excluding_tax + total_sales_tax
-
-            # Create a new Invoice instance
-            invoice = Invoice(
-                ntn=json_data.get("supplierNTN", ""),
-                name=json_data.get("supplierName", ""),
-                st_reg_no=json_data.get("supplierSTN", ""),
-                address=json_data.get("supplierAddress", ""),
-                customer_receipt_no=json_data.get("serialNumber", 0),
-                customer_ntn=extract_first_or_join(json_data.get("buyerNTN", "")),
-                customer_name=json_data.get("buyerName", ""),
-                customer_st_reg_no=json_data.get("buyerSTN", ""),
-                customer_phone_number=json_data.get("buyerContact", ""),
-                customer_address=json_data.get("buyerAddress", ""),
-                business_name=json_data.get("businessName", [""])[0],
-                date=json_data.get("date", ""),
-                total_amount_excluding_tax=total_amount_excluding_tax,
-                total_sales_tax=total_sales_tax,
-                total_amount_including_tax=total_amount_including_tax,
-            )
-
-            db.session.add(invoice)
-            db.session.flush()
-
-            # Add products
-            for product_name, quantity, rate, excl, sales, incl in zip(
-                json_data.get("products", []),
-                json_data.get("quantity", []),
-                json_data.get("rate", []),
-                json_data.get("excl", []),
-                json_data.get("sales", []),
-                json_data.get("incl", []),
-            ):
-                if product_name:  # Only create product if product_name is not empty
-                    product = Product(
-                        invoice_id=invoice.id,
-                        product_name=product_name,
-                        quantity=int(clean_float(quantity) if quantity else 0),
-                        rate=int(clean_float(rate) if rate else 0),
-                        tax=clean_float(sales) if sales else 0.0,
-                        price_with_tax=int(clean_float(incl) if incl else 0),
-                        amount_excluding_tax=clean_float(excl) if excl else 0.0,
-                        sales_tax=clean_float(sales) if sales else 0.0,
-                        amount_including_tax=clean_float(incl) if incl else 0.0,
-                    )
-                    db.session.add(product)
-
-            db.session.commit()
-
-            current_app.info_logger.info(f"Successfully processed and stored data from {file_path}.")
-            os.remove(file_path)
-
+        _, failed = store_json_files(files, batch_size)
+        if failed:
+            return f"Error processing JSON: {len(failed)} of {len(files)} files failed, first: {failed[0][1]}"
         return f"Successfully processed all JSON files."
 
     except Exception as e:
         db.session.rollback()
         current_app.error_logger.error(f"Error processing JSON: {e}")
-        return f"Error processing JSON: {e}"
\ No newline at end of file
+        return f"Error processing JSON: {e}"
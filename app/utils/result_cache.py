@@ -0,0 +1,121 @@
+import os
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    content_hash TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    cleaner_version TEXT NOT NULL,
+    pages TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (content_hash, model_version, cleaner_version)
+);
+CREATE INDEX IF NOT EXISTS ix_results_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class ResultCache:
+    """
+    Cleaned extraction results keyed by (content hash, model version, cleaner version).
+    The cleaner version is opaque here, callers fold extraction settings into it.
+
+    Entries live in a SQLite file so every worker process shares them.
+    Once the stored results exceed `max_bytes` the least recently used
+    entries are evicted. Hit and miss counters are kept in the same file.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _count(conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, content_hash, model_version, cleaner_version):
+        """Returns the cached list of cleaned pages, or None on a miss."""
+        key = (content_hash, model_version, cleaner_version)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT pages FROM results "
+                "WHERE content_hash = ? AND model_version = ? AND cleaner_version = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute(
+                "UPDATE results SET last_used = ? "
+                "WHERE content_hash = ? AND model_version = ? AND cleaner_version = ?",
+                (time.time(), *key),
+            )
+            self._count(conn, "hits")
+        return json.loads(row[0])
+
+    def put(self, content_hash, model_version, cleaner_version, pages):
+        """Stores the cleaned pages of a document and evicts old entries if over budget."""
+        payload = json.dumps(pages)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(content_hash, model_version, cleaner_version, pages, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, model_version, cleaner_version, payload, len(payload), now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT rowid, size FROM results ORDER BY last_used").fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        conn.executemany("DELETE FROM results WHERE rowid = ?", evicted)
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (len(evicted),),
+        )
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and the current size of the cache."""
+        with closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
@@ -1,92 +1,175 @@
+import time
+import numpy as np
 import pandas as pd
+from sqlalchemy import insert
 from utils.models import Invoice, Product
+from utils.summary import record_invoices, summary_entry
+from utils.dates import parse_invoice_date
 from flask_sqlalchemy import SQLAlchemy
 import logging
 
+# CSV column -> invoices column
+INVOICE_COLUMNS = {
+    "NTN": "ntn",
+    "NAME": "name",
+    "S.T.Reg. No": "st_reg_no",
+    "Address": "address",
+    "Customer_Receipt_NO": "customer_receipt_no",
+    "Customer_NTN": "customer_ntn",
+    "Customer_NAME": "customer_name",
+    "Customer_S.T.Reg. No": "customer_st_reg_no",
+    "Customer_Phone Number": "customer_phone_number",
+    "Customer_Address": "customer_address",
+    "Business Name": "business_name",
+    "Date": "date",
+    "Total Amount Excluding Taxes": "total_amount_excluding_tax",
+    "Total Sales Tax @ 18%": "total_sales_tax",
+    "Total Amount Including Taxes": "total_amount_including_tax",
+}
+
+# CSV column pattern of product slot {i} -> products column
+PRODUCT_COLUMNS = {
+    "Product {i}": "product_name",
+    "Quantity_Product_{i}": "quantity",
+    "Rate_Product_{i}": "rate",
+    "Tax_Product_{i}": "tax",
+    "Product_{i}_Price_with_Tax": "price_with_tax",
+    "Amount Excluding Taxes_Product_{i}": "amount_excluding_tax",
+    "Sales Tax @ 18%_Product_{i}": "sales_tax",
+    "Amount Including Taxes_Product_{i}": "amount_including_tax",
+}
+PRODUCT_SLOTS = range(1, 5)  # Up to 4 products per invoice
+
+
+def _records(frame):
+    # Plain Python values, NaN becomes NULL
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def products_long(chunk):
+    """
+    Reshapes the Product 1..4 column groups of a chunk into one row per product.
+    Args:
+        chunk (pd.DataFrame): CSV rows.
+    Returns:
+        pd.DataFrame: Product columns plus `row`, the position of the invoice in the chunk.
+    """
+    slots = []
+    for i in PRODUCT_SLOTS:
+        columns = {pattern.format(i=i): name for pattern, name in PRODUCT_COLUMNS.items()}
+        if not set(columns).issubset(chunk.columns):
+            continue
+        slot = chunk[list(columns)].rename(columns=columns)
+        slot.insert(0, "row", np.arange(len(chunk)))
+        slot.insert(1, "slot", i)
+        slots.append(slot)
+    if not slots:
+        return pd.DataFrame(columns=["row", "slot", *PRODUCT_COLUMNS.values()])
+    products = pd.concat(slots, ignore_index=True)
+    products = products[products["product_name"].notna()]
+    return products.sort_values(["row", "slot"], kind="stable")
+
+
+def seed_chunk(session, chunk, date_cache):
+    """
+    Bulk inserts one chunk of CSV rows and updates the summary.
+    Args:
+        session: The SQLAlchemy session, the caller owns the transaction.
+        chunk (pd.DataFrame): CSV rows.
+        date_cache (dict): Raw date text -> parsed date, shared across chunks.
+    Returns:
+        tuple: Number of invoices and products inserted.
+    """
+    invoices = chunk[list(INVOICE_COLUMNS)].rename(columns=INVOICE_COLUMNS)
+
+    # Dates repeat heavily, parse each distinct text once
+    for raw in invoices["date"].dropna().unique():
+        if raw not in date_cache:
+            date_cache[raw] = parse_invoice_date(raw)
+    invoices["invoice_date"] = invoices["date"].map(date_cache)
+
+    invoice_ids = np.array(session.execute(
+        insert(Invoice.__table__).returning(Invoice.__table__.c.id, sort_by_parameter_order=True),
+        _records(invoices),
+    ).scalars().all())
+
+    products = products_long(chunk)
+    product_names = products.groupby("row")["product_name"].agg(list)
+    if len(products):
+        products["invoice_id"] = invoice_ids[products["row"].to_numpy()]
+        session.execute(insert(Product.__table__), _records(products.drop(columns=["row", "slot"])))
+
+    # Keep the dashboard highlights in step, in the same transaction
+    names = invoices["name"].tolist()
+    customers = invoices["customer_name"].tolist()
+    record_invoices(session, [
+        summary_entry(names[row], customers[row], product_names.get(row, []))
+        for row in range(len(invoices))
+    ])
+    return len(invoice_ids), len(products)
+
+
 def seed_data(
     start: int = 0,
     end: int = 5,
     file_path: str = None,
     db: SQLAlchemy = None,
     info_logger: logging.Logger = None,
-    error_logger: logging.Logger = None
+    error_logger: logging.Logger = None,
+    chunksize: int = 10000
 ) -> None:
     """
     Seed data from a CSV file into the database.
+    The file is streamed in chunks of `chunksize` rows, each chunk is
+    inserted in one transaction, so memory stays flat for any file size.
 
     Args:
         start (int): Start index for reading data.
-        end (int): End index for reading data.
+        end (int): End index for reading data, None to read to the end.
         file_path (str): Path to the CSV file.
         db: SQLAlchemy database instance.
         info_logger: Logger for informational messages.
         error_logger: Logger for error messages.
+        chunksize (int): Rows per chunk and per transaction.
     """
     try:
-        # Load the CSV file
-        df = pd.read_csv(file_path,low_memory=False)
-
-        # Define required columns
-        required_columns = [
-            "NTN", "NAME", "S.T.Reg. No", "Address", "Customer_Receipt_NO", "Customer_NTN",
-            "Customer_NAME", "Customer_S.T.Reg. No", "Customer_Phone Number", "Customer_Address",
-            "Business Name", "Date", "Total Amount Excluding Taxes", "Total Sales Tax @ 18%",
-            "Total Amount Including Taxes"
-        ]
-
         # Check if all required columns are present
-        if not all(column in df.columns for column in required_columns):
+        header = pd.read_csv(file_path, nrows=0).columns
+        if not all(column in header for column in INVOICE_COLUMNS):
             error_logger.error(f"CSV file is missing required columns: {file_path}")
             return
 
-        # Iterate over the rows and insert data into the database
-        for index, row in df.iloc[start:end].iterrows():
-            # Create an Invoice object
-            invoice = Invoice(
-                ntn=row["NTN"],
-                name=row["NAME"],
-                st_reg_no=row["S.T.Reg. No"],
-                address=row["Address"],
-                customer_receipt_no=row["Customer_Receipt_NO"],
-                customer_ntn=row["Customer_NTN"],
-                customer_name=row["Customer_NAME"],
-                customer_st_reg_no=row["Customer_S.T.Reg. No"],
-                customer_phone_number=row["Customer_Phone Number"],
-                customer_address=row["Customer_Address"],
-                business_name=row["Business Name"],
-                date=row["Date"],
-                total_amount_excluding_tax=row["Total Amount Excluding Taxes"],
-                total_sales_tax=row["Total Sales Tax @ 18%"],
-                total_amount_including_tax=row["Total Amount Including Taxes"],
-            )
+        # Skip straight to `start` without parsing the rows before it
+        reader = pd.read_csv(
+            file_path,
+            chunksize=chunksize,
+            skiprows=range(1, start + 1),
+            nrows=None if end is None else max(end - start, 0),
+            low_memory=False,
+        )
+
+        started = time.perf_counter()
+        invoice_count, product_count = 0, 0
+        date_cache = {}
+        for chunk in reader:
+            try:
+                invoices, products = seed_chunk(db.session, chunk, date_cache)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            invoice_count += invoices
+            product_count += products
 
-            # Add the invoice to the session
-            db.session.add(invoice)
-            db.session.commit()
-
-            # Add products for this invoice
-            for i in range(1, 5):  # Assuming there are up to 4 products
-                product_name = row[f"Product {i}"]
-                if pd.notna(product_name):  # Check if the product exists
-                    product = Product(
-                        invoice_id=invoice.id,
-                        product_name=product_name,
-                        quantity=row[f"Quantity_Product_{i}"],
-                        rate=row[f"Rate_Product_{i}"],
-                        tax=row[f"Tax_Product_{i}"],
-                        price_with_tax=row[f"Product_{i}_Price_with_Tax"],
-                        amount_excluding_tax=row[f"Amount Excluding Taxes_Product_{i}"],
-                        sales_tax=row[f"Sales Tax @ 18%_Product_{i}"],
-                        amount_including_tax=row[f"Amount Including Taxes_Product_{i}"],
-                    )
-                    db.session.add(product)
-
-            # Commit the changes
-            db.session.commit()
+            elapsed = time.perf_counter() - started
+            info_logger.info(
+                f"Seeded {invoice_count} invoices and {product_count} products from {file_path} "
+                f"in {elapsed:.1f}s ({invoice_count / max(elapsed, 1e-9):.0f} invoices/s)."
+            )
 
         # Log success
         info_logger.info(f"Data from index {start} to {end} in {file_path} has been seeded into the database.")
 
     except Exception as e:
         # Log error
-        error_logger.error(f"Error seeding data from {file_path}: {e}")
\ No newline at end of file
+        error_logger.error(f"Error seeding data from {file_path}: {e}")
@@ -0,0 +1,83 @@
+import os
+from flask import has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URI = "sqlite:///database.db"
+
+# Bind used by HTTP handlers, queries through it can never take the write lock
+READONLY_BIND = "readonly"
+
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 30000))
+
+# Applied to every SQLite connection
+SQLITE_PRAGMAS = {
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "cache_size": -64000,        # 64 MB page cache
+    "temp_store": "MEMORY",
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+# Applied to writable connections only; journal_mode is persisted in the file
+SQLITE_WRITER_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",     # Durable at checkpoints, safe against corruption in WAL mode
+}
+
+
+def database_config(uri=None, read_uri=None):
+    """
+    SQLAlchemy settings shared by the app and its worker processes.
+    Args:
+        uri (str): Database URI, defaults to $DATABASE_URL or a local SQLite file.
+        read_uri (str): URI for read-only queries, defaults to $DATABASE_READ_URL or `uri`.
+    Returns:
+        dict: Flask config entries.
+    """
+    uri = uri or os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URI)
+    read_uri = read_uri or os.environ.get("DATABASE_READ_URL", uri)
+    config = {"SQLALCHEMY_DATABASE_URI": uri, "SQLALCHEMY_BINDS": {}}
+
+    # A second in-memory SQLite engine would be a different, empty database
+    url = make_url(read_uri)
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        config["SQLALCHEMY_BINDS"][READONLY_BIND] = read_uri
+    return config
+
+
+def _sqlite_listeners(engine, readonly):
+    pragmas = dict(SQLITE_PRAGMAS)
+    pragmas.update({"query_only": "ON"} if readonly else SQLITE_WRITER_PRAGMAS)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy issue BEGIN itself so SAVEPOINTs nest inside real transactions
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection):
+        # Writers take the lock up front, a deferred upgrade can fail without waiting on busy_timeout
+        connection.exec_driver_sql("BEGIN" if readonly else "BEGIN IMMEDIATE")
+
+
+def configure_engines(db):
+    """Installs connection pragmas on the engines of `db`, call inside an app context."""
+    for bind_key, engine in db.engines.items():
+        if engine.dialect.name == "sqlite":
+            _sqlite_listeners(engine, readonly=bind_key == READONLY_BIND)
+
+
+class RoutingSession(Session):
+    """Session that sends everything issued while handling a request to the read-only bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            engines = self._db.engines
+            if READONLY_BIND in engines:
+                return engines[READONLY_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
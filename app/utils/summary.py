@@ -0,0 +1,186 @@
+from collections import Counter
+from sqlalchemy import select, update, delete, insert, func, bindparam
+from sqlalchemy.orm import selectinload
+from utils.models import db, Invoice, Product, SummaryCounter, DashboardSummary
+
+# Counter kinds and the highlight each one feeds
+UNIQUE_TOTALS = {
+    "seller": "unique_sellers",
+    "customer": "unique_customers",
+    "product": "unique_products",
+}
+TOTAL_INVOICES = "total_invoices"
+SUMMARY_NAMES = [TOTAL_INVOICES, *UNIQUE_TOTALS.values()]
+
+# Bumped by every ingestion, stamped on the counters it touches
+INGEST_GENERATION = "ingest_generation"
+
+# Keep IN lists below SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+def summary_entry(name, customer_name, product_names):
+    """Describes one invoice the way the summary counts it."""
+    return {"name": name, "customer_name": customer_name, "products": list(product_names)}
+
+
+def _countable(key):
+    # NULLs are not distinct values, and neither are NaNs coming from pandas
+    return key is not None and key == key
+
+
+def _bump(session, name, delta):
+    if not delta:
+        return
+    result = session.execute(
+        update(DashboardSummary).where(DashboardSummary.name == name)
+        .values(value=DashboardSummary.value + delta)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(DashboardSummary).values(name=name, value=delta))
+
+
+def _next_generation(session):
+    _bump(session, INGEST_GENERATION, 1)
+    return session.execute(
+        select(DashboardSummary.value).where(DashboardSummary.name == INGEST_GENERATION)
+    ).scalar()
+
+
+def _apply_kind(session, kind, deltas, generation):
+    """Applies reference count deltas for one kind, returns the change in distinct keys."""
+    existing = {}
+    keys = list(deltas)
+    for start in range(0, len(keys), CHUNK_SIZE):
+        rows = session.execute(
+            select(SummaryCounter.key, SummaryCounter.count)
+            .where(SummaryCounter.kind == kind, SummaryCounter.key.in_(keys[start:start + CHUNK_SIZE]))
+        ).all()
+        existing.update(rows)
+
+    inserts, updates, deletes = [], [], []
+    for key, delta in deltas.items():
+        count = existing.get(key, 0) + delta
+        if key not in existing:
+            if count > 0:
+                inserts.append({"kind": kind, "key": key, "count": count, "version": generation})
+        elif count > 0:
+            updates.append({"k": kind, "ky": key, "c": count, "v": generation})
+        else:
+            deletes.append(key)
+
+    if inserts:
+        session.execute(insert(SummaryCounter), inserts)
+    if updates:
+        session.connection().execute(
+            update(SummaryCounter.__table__)
+            .where(SummaryCounter.kind == bindparam("k"), SummaryCounter.key == bindparam("ky"))
+            .values(count=bindparam("c"), version=bindparam("v")),
+            updates,
+        )
+    for start in range(0, len(deletes), CHUNK_SIZE):
+        session.execute(
+            delete(SummaryCounter)
+            .where(SummaryCounter.kind == kind, SummaryCounter.key.in_(deletes[start:start + CHUNK_SIZE]))
+        )
+    return len(inserts) - len(deletes)
+
+
+def record_invoices(session, entries, sign=1):
+    """
+    Updates the dashboard summary for invoices being inserted (sign=1) or
+    deleted (sign=-1). Runs in the caller's transaction, so the summary
+    commits or rolls back together with the invoices themselves.
+    Args:
+        session: The SQLAlchemy session doing the ingestion.
+        entries (list): Dicts built by `summary_entry`.
+        sign (int): 1 for inserts, -1 for deletes.
+    """
+    entries = list(entries)
+    if not entries:
+        return
+
+    # Distinct counts ignore NULLs, the same as COUNT(DISTINCT ...)
+    deltas = {kind: Counter() for kind in UNIQUE_TOTALS}
+    for entry in entries:
+        if _countable(entry["name"]):
+            deltas["seller"][entry["name"]] += sign
+        if _countable(entry["customer_name"]):
+            deltas["customer"][entry["customer_name"]] += sign
+        for product_name in entry["products"]:
+            if _countable(product_name):
+                deltas["product"][product_name] += sign
+
+    generation = _next_generation(session)
+    _bump(session, TOTAL_INVOICES, sign * len(entries))
+    for kind, kind_deltas in deltas.items():
+        _bump(session, UNIQUE_TOTALS[kind], _apply_kind(session, kind, kind_deltas, generation))
+
+
+def delete_invoices(session, invoice_ids):
+    """Deletes invoices and their products and updates the summary in the same transaction."""
+    invoices = session.execute(
+        select(Invoice).where(Invoice.id.in_(invoice_ids))
+        .options(selectinload(Invoice.products))
+    ).scalars().all()
+    record_invoices(session, [
+        summary_entry(invoice.name, invoice.customer_name, [p.product_name for p in invoice.products])
+        for invoice in invoices
+    ], sign=-1)
+    for invoice in invoices:
+        session.delete(invoice)
+
+
+def get_summary():
+    """Returns the dashboard highlights, a single primary key scan."""
+    values = dict(db.session.execute(select(DashboardSummary.name, DashboardSummary.value)).all())
+    return {name: values.get(name, 0) for name in SUMMARY_NAMES}
+
+
+def counter_version(kind, key):
+    """Generation of the last ingestion touching `key`, None once no invoice references it."""
+    return db.session.execute(
+        select(SummaryCounter.version).where(SummaryCounter.kind == kind, SummaryCounter.key == key)
+    ).scalar()
+
+
+def rebuild_summary(session):
+    """Recomputes every counter from the invoice tables, used to initialise existing databases."""
+    # Generations keep increasing across rebuilds so cached reports never match stale versions
+    generation = (session.execute(
+        select(DashboardSummary.value).where(DashboardSummary.name == INGEST_GENERATION)
+    ).scalar() or 0) + 1
+    session.execute(delete(SummaryCounter))
+    session.execute(delete(DashboardSummary))
+
+    sources = {
+        "seller": select(Invoice.name, func.count()).where(Invoice.name.is_not(None)).group_by(Invoice.name),
+        "customer": select(Invoice.customer_name, func.count())
+        .where(Invoice.customer_name.is_not(None)).group_by(Invoice.customer_name),
+        "product": select(Product.product_name, func.count())
+        .where(Product.product_name.is_not(None)).group_by(Product.product_name),
+    }
+    totals = {
+        TOTAL_INVOICES: session.execute(select(func.count(Invoice.id))).scalar(),
+        INGEST_GENERATION: generation,
+    }
+    for kind, query in sources.items():
+        rows = [
+            {"kind": kind, "key": key, "count": count, "version": generation}
+            for key, count in session.execute(query)
+        ]
+        if rows:
+            session.execute(insert(SummaryCounter), rows)
+        totals[UNIQUE_TOTALS[kind]] = len(rows)
+    session.execute(insert(DashboardSummary), [{"name": name, "value": value} for name, value in totals.items()])
+
+
+def ensure_summary():
+    """Builds the summary once for databases that predate it."""
+    built = db.session.execute(
+        select(DashboardSummary.value).where(DashboardSummary.name == INGEST_GENERATION)
+    ).scalar()
+    if built:
+        return
+    rebuild_summary(db.session)
+    db.session.commit()
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+# Documents the pipeline can process
+ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+
+
+class UploadError(Exception):
+    """Rejected upload, `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def copy_stream(stream, f, digest, max_bytes=None, chunk_size=CHUNK_SIZE):
+    """
+    Copies a stream into an open file, hashing the bytes as they pass through.
+    Args:
+        stream: File-like object to read from.
+        f: Binary file to write to.
+        digest: hashlib object updated with every byte written.
+        max_bytes (int): Fail once more than this many bytes arrive.
+        chunk_size (int): Bytes read per iteration.
+    Returns:
+        int: The number of bytes written.
+    """
+    size = 0
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise UploadError(f"Upload exceeds the limit of {max_bytes} bytes", 413)
+        digest.update(chunk)
+        f.write(chunk)
+    return size
+
+
+def save_stream(stream, file_path, chunk_size=CHUNK_SIZE, max_bytes=None):
+    """
+    Writes a stream to disk, hashing the bytes as they pass through.
+    Args:
+        stream: File-like object to read from.
+        file_path (str): Destination path.
+        chunk_size (int): Bytes read per iteration.
+        max_bytes (int): Optional size limit, the partial file is removed when exceeded.
+    Returns:
+        tuple: The SHA-256 hex digest and the number of bytes written.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "wb") as f:
+            size = copy_stream(stream, f, digest, max_bytes, chunk_size)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return digest.hexdigest(), size
+
+
+def unique_file_path(upload_folder, filename):
+    """Destination for an uploaded file, named by a fresh id so uploads never collide."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise UploadError(f"Unsupported file type: {filename}", 415)
+    return os.path.join(upload_folder, f"{uuid.uuid4().hex}{extension}")
+
+
+class ChunkedUploads:
+    """
+    Resumable uploads: a file is declared, sent as consecutive byte ranges,
+    and completed once all bytes arrived.
+
+    Partial files live in `<upload_folder>/.partial` next to a small JSON
+    description, so an interrupted upload resumes from the bytes on disk.
+    The running SHA-256 of each upload is kept in memory and rebuilt from
+    the partial file when it is missing, e.g. after a restart.
+    """
+
+    def __init__(self, upload_folder, max_file_bytes, max_chunk_bytes, expiry=24 * 3600):
+        self.upload_folder = upload_folder
+        self.partial_folder = os.path.join(upload_folder, ".partial")
+        self.max_file_bytes = max_file_bytes
+        self.max_chunk_bytes = max_chunk_bytes
+        self.expiry = expiry
+        self._digests = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.partial_folder, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not upload_id.isalnum():
+            raise UploadError("Upload not found", 404)
+        base = os.path.join(self.partial_folder, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._digests.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+
+    def _digest(self, upload_id, part_path, offset):
+        cached = self._digests.get(upload_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest
+
+    def init(self, filename, size):
+        """
+        Declares a new upload.
+        Args:
+            filename (str): Client file name, only its extension is kept.
+            size (int): Total size in bytes.
+        Returns:
+            dict: The upload status.
+        """
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("size must be a positive number of bytes")
+        if size > self.max_file_bytes:
+            raise UploadError(f"File exceeds the limit of {self.max_file_bytes} bytes", 413)
+        unique_file_path(self.upload_folder, filename or "")  # Validates the extension
+
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        open(part_path, "wb").close()
+        with open(meta_path, "w") as f:
+            json.dump({"filename": os.path.basename(filename), "size": size, "created_at": time.time()}, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """Returns the declared size and how many bytes have been received."""
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            offset = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            raise UploadError("Upload not found", 404)
+        return {
+            "upload_id": upload_id,
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "offset": offset,
+            "chunk_size": self.max_chunk_bytes,
+        }
+
+    def append(self, upload_id, offset, stream):
+        """
+        Writes the bytes of `stream` at `offset`.
+        Chunks resent after a lost response are acknowledged without writing.
+        Returns:
+            dict: The upload status.
+        """
+        with self._upload_lock(upload_id):
+            status = self.status(upload_id)
+            if offset != status["offset"]:
+                if offset < status["offset"]:
+                    return status
+                raise UploadError(f"Expected offset {status['offset']}", 409)
+
+            _, part_path = self._paths(upload_id)
+            digest = self._digest(upload_id, part_path, offset)
+            budget = min(self.max_chunk_bytes, status["size"] - offset)
+            try:
+                with open(part_path, "ab") as f:
+                    written = copy_stream(stream, f, digest, budget)
+            except Exception:
+                # Drop the partial chunk so the client can resend it whole
+                with open(part_path, "ab") as f:
+                    f.truncate(offset)
+                self._digests.pop(upload_id, None)
+                raise
+            self._digests[upload_id] = (offset + written, digest)
+            status["offset"] = offset + written
+            return status
+
+    def complete(self, upload_id, sha256=None):
+        """
+        Moves a fully received upload into the upload folder under a unique name.
+        Args:
+            upload_id (str): The upload to complete.
+            sha256 (str): Optional client-side hash to verify against.
+        Returns:
+            tuple: The file id, its path and its SHA-256.
+        """
+        with self._upload_lock(upload_id):
+            status = self.status(upload_id)
+            if status["offset"] != status["size"]:
+                raise UploadError(f"Upload incomplete: {status['offset']} of {status['size']} bytes", 409)
+
+            meta_path, part_path = self._paths(upload_id)
+            content_hash = self._digest(upload_id, part_path, status["offset"]).hexdigest()
+            if sha256 and sha256.lower() != content_hash:
+                raise UploadError("Checksum mismatch", 422)
+
+            file_path = unique_file_path(self.upload_folder, status["filename"])
+            os.replace(part_path, file_path)
+            os.remove(meta_path)
+        self._forget(upload_id)
+        file_id = os.path.splitext(os.path.basename(file_path))[0]
+        return file_id, file_path, content_hash
+
+    def expire(self):
+        """Removes uploads abandoned for longer than `expiry` seconds."""
+        cutoff = time.time() - self.expiry
+        for name in os.listdir(self.partial_folder):
+            upload_id, extension = os.path.splitext(name)
+            if extension != ".part":
+                continue
+            try:
+                meta_path, part_path = self._paths(upload_id)
+                # The partial file is touched by every chunk, idle uploads stop updating it
+                if os.path.getmtime(part_path) < cutoff:
+                    os.remove(part_path)
+                    os.remove(meta_path)
+                    self._forget(upload_id)
+            except (OSError, UploadError):
+                continue
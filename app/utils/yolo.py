@@ -1,13 +1,14 @@
 import os
 import cv2
 import numpy as np
-import onnxruntime as ort
-from ultralytics import YOLO
+from utils import onnx_engine
+from utils.onnx_engine import CLASS_NAMES
 
 def load_onnx_model(model_path):
-    return ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    return onnx_engine.create_session(model_path)
 
 def load_pt_model(model_path):
+    from ultralytics import YOLO
     return YOLO(model_path)
 
 def preprocess_image(image_path, input_shape=(640, 640)):
@@ -76,35 +77,14 @@ def main():
         boxes, scores, class_ids = postprocess_output_pt(results)
     elif model_path.endswith('.onnx'):
         session = load_onnx_model(model_path)
-        image, _ = preprocess_image(image_path)
-        outputs = run_inference_onnx(session, image)
-        boxes, scores, class_ids = postprocess_output_pt(outputs)
+        boxes, scores, class_ids = onnx_engine.detect(session, cv2.imread(image_path))
     else:
         raise ValueError("Unsupported model format.")
 
     # Load original image for drawing
     original_image = cv2.imread(image_path)
 
-    class_names = ["SRNO"
-                ,"businessName"
-                ,"buyerAddress"
-                ,"buyerContact"
-                ,"buyerNTN"
-                ,"buyerName"
-                ,"buyerSTN"
-                ,"date"
-                ,"excl"
-                ,"incl"
-                ,"products"
-                ,"quantity"
-                ,"rate"
-                ,"sales"
-                ,"serialNumber"
-                ,"supplierAddress"
-                ,"supplierNTN"
-                ,"supplierName"
-                ,"supplierSTN"
-                ,"total"]
+    class_names = CLASS_NAMES
 
     draw_boxes(original_image, boxes, scores, class_ids, class_names)
     os.makedirs(output_dir, exist_ok=True)